@@ -0,0 +1,189 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 22:39:45.463995
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('management_district',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('image_url', sa.String(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('office',
+    sa.Column('DEPARTMENT_ID', sa.Integer(), nullable=False),
+    sa.Column('DEPARTMENT_NAME', sa.String(length=50), nullable=False),
+    sa.Column('MANAGER_ID', sa.Integer(), nullable=False),
+    sa.Column('LOCATION_ID', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('DEPARTMENT_ID')
+    )
+    op.create_table('order_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('salesman_id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=50), nullable=False),
+    sa.Column('grade', sa.Integer(), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('commission', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'salesman_id', 'city', 'grade')
+    )
+    op.create_table('passwords',
+    sa.Column('hashed_key', sa.String(length=250), nullable=False),
+    sa.Column('lookup_key', sa.String(length=64), nullable=True),
+    sa.Column('hashed_password', sa.String(length=250), nullable=False),
+    sa.PrimaryKeyConstraint('hashed_key')
+    )
+    with op.batch_alter_table('passwords', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_passwords_lookup_key'), ['lookup_key'], unique=True)
+
+    op.create_table('salesman',
+    sa.Column('salesman_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('city', sa.String(length=50), nullable=False),
+    sa.Column('commission', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('salesman_id')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('full_name', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=50), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('division', sa.String(length=20), nullable=False),
+    sa.Column('district', sa.String(length=20), nullable=False),
+    sa.Column('address', sa.String(length=250), nullable=False),
+    sa.Column('salt', sa.String(length=250), nullable=False),
+    sa.Column('special_key', sa.String(length=250), nullable=False),
+    sa.Column('photo_url', sa.String(length=250), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+
+    op.create_table('customer',
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('cust_name', sa.String(length=50), nullable=False),
+    sa.Column('city', sa.String(length=50), nullable=False),
+    sa.Column('grade', sa.Integer(), nullable=False),
+    sa.Column('salesman_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['salesman_id'], ['salesman.salesman_id'], ),
+    sa.PrimaryKeyConstraint('customer_id')
+    )
+    op.create_table('items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=50), nullable=False),
+    sa.Column('description', sa.String(length=250), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_items_description'), ['description'], unique=False)
+        batch_op.create_index(batch_op.f('ix_items_title'), ['title'], unique=False)
+
+    op.create_table('management_restaurant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('restaurant_name', sa.String(length=255), nullable=False),
+    sa.Column('restaurant_address', sa.String(length=255), nullable=False),
+    sa.Column('cover_photo', sa.String(length=255), nullable=False),
+    sa.Column('ratings', sa.Float(), nullable=False),
+    sa.Column('number_of_raters', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), server_default='0', nullable=False),
+    sa.Column('district_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['district_id'], ['management_district.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('management_restaurant', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_management_restaurant_district_id'), ['district_id'], unique=False)
+        batch_op.create_index('ix_management_restaurant_ratings_id', ['ratings', 'id'], unique=False)
+
+    op.create_table('management_food',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('food_name', sa.String(length=50), nullable=False),
+    sa.Column('food_image', sa.String(length=255), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('ratings', sa.Float(), nullable=False),
+    sa.Column('number_of_raters', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), server_default='0', nullable=False),
+    sa.Column('restaurant_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['management_restaurant.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('management_food', schema=None) as batch_op:
+        batch_op.create_index('ix_management_food_ratings_id', ['ratings', 'id'], unique=False)
+        batch_op.create_index('ix_management_food_restaurant_id_ratings', ['restaurant_id', 'ratings'], unique=False)
+
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('ord_date', sa.Date(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('salesman_id', sa.Integer(), nullable=True),
+    sa.Column('food_id', sa.Integer(), nullable=True),
+    sa.Column('restaurant_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=True),
+    sa.Column('status', sa.String(length=20), server_default='queued', nullable=False),
+    sa.Column('promised_at', sa.DateTime(), nullable=True),
+    sa.Column('idempotency_key', sa.String(length=64), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.customer_id'], ),
+    sa.ForeignKeyConstraint(['food_id'], ['management_food.id'], ),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['management_restaurant.id'], ),
+    sa.ForeignKeyConstraint(['salesman_id'], ['salesman.salesman_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('customer_id', 'idempotency_key', name='uq_orders_customer_idempotency_key')
+    )
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index('ix_orders_restaurant_id_status', ['restaurant_id', 'status'], unique=False)
+
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_restaurant_id_status')
+
+    op.drop_table('orders')
+    with op.batch_alter_table('management_food', schema=None) as batch_op:
+        batch_op.drop_index('ix_management_food_restaurant_id_ratings')
+        batch_op.drop_index('ix_management_food_ratings_id')
+
+    op.drop_table('management_food')
+    with op.batch_alter_table('management_restaurant', schema=None) as batch_op:
+        batch_op.drop_index('ix_management_restaurant_ratings_id')
+        batch_op.drop_index(batch_op.f('ix_management_restaurant_district_id'))
+
+    op.drop_table('management_restaurant')
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_items_title'))
+        batch_op.drop_index(batch_op.f('ix_items_description'))
+
+    op.drop_table('items')
+    op.drop_table('customer')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
+    op.drop_table('salesman')
+    with op.batch_alter_table('passwords', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_passwords_lookup_key'))
+
+    op.drop_table('passwords')
+    op.drop_table('order_daily_rollups')
+    op.drop_table('office')
+    op.drop_table('management_district')
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# point SQLALCHEMY_DB_URI at an empty database (e.g. MySQL in a container) to benchmark something other than sqlite
+DB_FILE = os.path.join(tempfile.mkdtemp(), "api_suite.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+os.environ.setdefault("ACCOUNT_SID", "benchmark")
+os.environ.setdefault("AUTH_TOKEN", "benchmark")
+os.environ.setdefault("OTP_TRANSPORT", "fake")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import httpx
+
+from users_app import models
+from users_app.crud import get_lookup_key, get_password_hash
+from users_app.database import engine
+from users_app.main import app
+
+PASSWORD = "benchmark-password"
+SCENARIOS = ["signup", "login", "token_verify", "districts", "foods", "restaurants", "restaurants_by_district", "menu"]
+
+
+class Seeder:
+    def __init__(self, districts: int, restaurants: int, foods: int):
+        self.districts = districts
+        self.restaurants = restaurants
+        self.foods = foods
+        self.users = 0
+        self.hashed_password = get_password_hash(PASSWORD)
+
+    def catalogue(self):
+        models.Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(models.District.__table__.insert(), [
+                {"id": d, "name": f"District {d}", "image_url": ""} for d in range(1, self.districts + 1)
+            ])
+            conn.execute(models.Restaurant.__table__.insert(), [
+                {"id": r, "restaurant_name": f"Restaurant {r}", "restaurant_address": "", "cover_photo": "",
+                 "ratings": random.uniform(1, 5), "number_of_raters": random.randrange(100), "score": 0,
+                 "district_id": r % self.districts + 1}
+                for r in range(1, self.restaurants + 1)
+            ])
+            conn.execute(models.Food.__table__.insert(), [
+                {"food_name": f"Dish {r}-{f}", "food_image": "", "price": random.randrange(100, 900),
+                 "ratings": random.uniform(1, 5), "number_of_raters": random.randrange(100), "score": 0, "restaurant_id": r}
+                for r in range(1, self.restaurants + 1) for f in range(self.foods)
+            ])
+
+    def users_up_to(self, count: int, batch_size: int = 5000):
+        # every seeded user shares one bcrypt hash, hashing each would dominate seeding time
+        for start in range(self.users, count, batch_size):
+            stop = min(start + batch_size, count)
+            users, passwords = [], []
+            for i in range(start, stop):
+                salt, special_key = f"salt-{i}", f"user{i}@bench.local"
+                users.append({
+                    "full_name": f"User {i}", "email": f"user{i}@bench.local", "phone": "+8801000000000",
+                    "division": "Dhaka", "district": "Dhaka", "address": "Bench", "photo_url": "",
+                    "salt": salt, "special_key": special_key, "is_active": True,
+                })
+                passwords.append({"hashed_key": f"bench-{i}", "lookup_key": get_lookup_key(salt + special_key), "hashed_password": self.hashed_password})
+            with engine.begin() as conn:
+                conn.execute(models.User.__table__.insert(), users)
+                conn.execute(models.Password.__table__.insert(), passwords)
+        self.users = max(self.users, count)
+
+
+class Scenarios:
+    def __init__(self, client: httpx.AsyncClient, seeder: Seeder, token: str):
+        self.client = client
+        self.seeder = seeder
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.signups = 0
+
+    async def signup(self):
+        self.signups += 1
+        return await self.client.post("/api/v1/users/", json={
+            "full_name": "Bench Signup", "email": f"signup{self.signups}-{time.monotonic_ns()}@bench.local",
+            "phone": "1000000000", "division": "Dhaka", "district": "Dhaka", "address": "Bench", "photo_url": "",
+            "password": PASSWORD,
+        })
+
+    async def login(self):
+        email = f"user{random.randrange(self.seeder.users)}@bench.local"
+        return await self.client.post("/api/v1/token/", data={"username": email, "password": PASSWORD})
+
+    async def token_verify(self):
+        return await self.client.get("/api/v1/token/verify/", headers=self.auth)
+
+    async def districts(self):
+        return await self.client.get("/api/v1/district/")
+
+    async def foods(self):
+        return await self.client.get("/api/v1/food/")
+
+    async def restaurants(self):
+        return await self.client.get("/api/v1/restaurant/")
+
+    async def restaurants_by_district(self):
+        return await self.client.get(f"/api/v1/restaurant/{random.randint(1, self.seeder.districts)}")
+
+    async def menu(self):
+        return await self.client.get(f"/api/v1/restaurant/menu/{random.randint(1, self.seeder.restaurants)}/")
+
+
+def percentile(timings: list[float], p: float):
+    return timings[min(len(timings) - 1, max(0, int(len(timings) * p / 100 + 0.5) - 1))]
+
+async def run(call, requests: int, concurrency: int):
+    timings, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await call()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+    }
+
+
+async def suite(args):
+    seeder = Seeder(args.districts, args.restaurants, args.foods)
+    seeder.catalogue()
+    seeder.users_up_to(args.users)
+    results = {"scenarios": {}, "login_scaling": []}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.post("/api/v1/token/", data={"username": "user0@bench.local", "password": PASSWORD})
+        scenarios = Scenarios(client, seeder, response.json()["access_token"])
+        for name in args.scenarios:
+            # bcrypt bound scenarios get fewer requests so a run stays in minutes
+            requests = args.auth_requests if name in ("signup", "login") else args.requests
+            call = getattr(scenarios, name)
+            await run(call, min(requests, args.concurrency), args.concurrency)
+            results["scenarios"][name] = await run(call, requests, args.concurrency)
+            print(format_row(name, results["scenarios"][name]))
+        if args.login_scaling:
+            print("\nlogin scaling")
+            for count in args.login_scaling:
+                seeder.users_up_to(count)
+                row = await run(scenarios.login, args.auth_requests, args.concurrency)
+                results["login_scaling"].append({"users": count, **row})
+                print(format_row(f"{count} users", row))
+    return results
+
+
+def format_row(name: str, row: dict):
+    return (f"{name:<26} {row['throughput_rps']:>9.1f} rps  p50 {row['p50_ms']:>8.2f}  "
+            f"p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms  errors {row['errors']}")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: dict, baseline: dict, threshold: float):
+    # a regression is p95 growing or throughput shrinking by more than threshold
+    regressions = []
+    print(f"\n{'scenario':<26} {'p95 ms':>20} {'rps':>20}")
+    for name, row in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        p95_change = row["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0
+        rps_change = row["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0
+        flag = p95_change > threshold or rps_change < -threshold
+        if flag:
+            regressions.append(name)
+        print(f"{name:<26} {old['p95_ms']:>8.2f} -> {row['p95_ms']:>8.2f} {old['throughput_rps']:>8.1f} -> {row['throughput_rps']:>8.1f}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API hot paths against a seeded database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--districts", type=int, default=8)
+    parser.add_argument("--restaurants", type=int, default=200)
+    parser.add_argument("--foods", type=int, default=20, help="foods per restaurant")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per catalogue and token scenario")
+    parser.add_argument("--auth-requests", type=int, default=100, help="requests per signup and login scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--login-scaling", type=lambda value: [int(count) for count in value.split(",") if count], default=[1000, 10000, 50000],
+                        help="comma separated user counts, empty to skip")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        **asyncio.run(suite(args)),
+    }
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, default=str))
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            print(f"\nregressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
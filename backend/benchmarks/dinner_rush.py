@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "dinner_rush.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from users_app import models, schemas
+from users_app.crud import create_order
+from users_app.database import AsyncSessionLocal, engine
+from users_app.kitchen import kitchen
+
+
+def seed(restaurants: int, foods_per_restaurant: int, customers: int):
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.District.__table__.insert(), [{"id": 1, "name": "Dhaka", "image_url": ""}])
+        conn.execute(models.Restaurant.__table__.insert(), [
+            {"id": r, "restaurant_name": f"Kitchen {r}", "restaurant_address": "", "cover_photo": "", "ratings": 0, "number_of_raters": 0, "score": 0, "district_id": 1}
+            for r in range(1, restaurants + 1)
+        ])
+        conn.execute(models.Food.__table__.insert(), [
+            {"id": (r - 1) * foods_per_restaurant + f, "food_name": f"Dish {f}", "food_image": "", "price": random.randrange(100, 900),
+             "ratings": 0, "number_of_raters": 0, "score": 0, "restaurant_id": r}
+            for r in range(1, restaurants + 1) for f in range(1, foods_per_restaurant + 1)
+        ])
+        conn.execute(models.Salesman.__table__.insert(), [{"salesman_id": 1, "name": "House", "city": "Dhaka", "commission": 0.1}])
+        conn.execute(models.Customer.__table__.insert(), [
+            {"customer_id": c, "cust_name": f"Customer {c}", "city": "Dhaka", "grade": c % 3 + 1, "salesman_id": 1}
+            for c in range(1, customers + 1)
+        ])
+
+
+def arrival_times(orders: int, duration: float):
+    # rush profile: arrivals ramp up to a peak two thirds of the way in, then tail off
+    times = sorted(random.triangular(0, duration, duration * 2 / 3) for _ in range(orders))
+    return times
+
+
+async def place(order: schemas.OrderCreate, key: str, latencies: list):
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        db_order = await create_order(db, order, key)
+    latencies.append((time.perf_counter() - started) * 1000)
+    return db_order.id
+
+
+async def kitchen_worker(restaurant_ids: list[int], stop: asyncio.Event, stats: dict):
+    async with AsyncSessionLocal() as db:
+        while not stop.is_set():
+            for restaurant_id in restaurant_ids:
+                stats["max_depth"] = max(stats["max_depth"], kitchen.status(restaurant_id)["queue_depth"])
+                stats["cooked"] += len(await kitchen.next_batch(db, restaurant_id))
+            await asyncio.sleep(0.05)
+
+
+async def rush(args):
+    seed(args.restaurants, args.foods, args.customers)
+    async with AsyncSessionLocal() as db:
+        await kitchen.ensure_loaded(db)
+    stop = asyncio.Event()
+    stats = {"max_depth": 0, "cooked": 0}
+    kitchens = list(range(1, args.restaurants + 1))
+    workers = [asyncio.create_task(kitchen_worker(kitchens[i::args.kitchen_workers], stop, stats)) for i in range(args.kitchen_workers)]
+
+    latencies = []
+    placed = {}
+    pending = set()
+    limit = asyncio.Semaphore(args.concurrency)
+    started = time.perf_counter()
+
+    async def submit(order, key):
+        async with limit:
+            placed.setdefault(key, set()).add(await place(order, key, latencies))
+
+    for at in arrival_times(args.orders, args.duration):
+        delay = started + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        order = schemas.OrderCreate(
+            customer_id=random.randint(1, args.customers),
+            food_id=random.randint(1, args.restaurants * args.foods),
+            quantity=random.randint(1, 4),
+        )
+        key = uuid.uuid4().hex
+        pending.add(asyncio.create_task(submit(order, key)))
+        if random.random() < args.retry_rate:
+            # a client that timed out and retried with the same idempotency key
+            pending.add(asyncio.create_task(submit(order, key)))
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*workers)
+
+    latencies.sort()
+    duplicates = sum(len(ids) - 1 for ids in placed.values())
+    print(f"placed {len(placed)} orders ({len(latencies)} requests incl. retries) in {elapsed:.1f}s = {len(placed) / elapsed * 60:.0f} orders/min")
+    for p in (50, 95, 99):
+        print(f"placement p{p}: {latencies[int(len(latencies) * p / 100) - 1]:.1f} ms")
+    print(f"max kitchen queue depth {stats['max_depth']}, batched to kitchens {stats['cooked']}, duplicate orders {duplicates}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a synthetic dinner rush against order placement and the kitchen scheduler")
+    parser.add_argument("--orders", type=int, default=3000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--restaurants", type=int, default=50)
+    parser.add_argument("--foods", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--kitchen-workers", type=int, default=2)
+    parser.add_argument("--retry-rate", type=float, default=0.05)
+    asyncio.run(rush(parser.parse_args()))
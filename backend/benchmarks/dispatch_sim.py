@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'dispatch_sim.db')}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from users_app import models
+from users_app.dispatch import DispatchEngine
+
+
+def build(args, weights: list[float]):
+    # riders are staffed in proportion to each city's share of the orders
+    engine = DispatchEngine(strategy=args.strategy, max_load=args.max_load)
+    cities = [f"City {c}" for c in range(args.cities)]
+    salesman_id = 0
+    for city, weight in zip(cities, weights):
+        for _ in range(max(1, round(args.riders * weight / sum(weights)))):
+            salesman_id += 1
+            engine.add_rider(models.Salesman(salesman_id=salesman_id, name="", city=city, commission=random.choice((0.05, 0.08, 0.1, 0.12))))
+    return engine, cities
+
+
+def percentile(values: list[float], p: float):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def linear_assign(riders: list, max_load: int):
+    # what a plain scan over the city's riders costs per order, for comparison
+    free = [rider for rider in riders if rider.online and rider.load < max_load]
+    return min(free, key=lambda rider: (rider.load, rider.commission)) if free else None
+
+
+def simulate(args):
+    random.seed(args.seed)
+    # a few busy cities and a long tail
+    weights = [1 / (rank + 1) for rank in range(args.cities)]
+    engine, cities = build(args, weights)
+    in_flight = int(len(engine.riders) * args.max_load * args.utilization)
+    active: list[tuple[int, str]] = []
+    assign_ns, rebalance_ms = [], []
+    pending_peak = moved = 0
+    order_id = 0
+    started = time.perf_counter()
+    for step in range(args.orders):
+        city = random.choices(cities, weights)[0]
+        order_id += 1
+        began = time.perf_counter_ns()
+        salesman_id = engine.assign(city)
+        assign_ns.append(time.perf_counter_ns() - began)
+        if salesman_id is not None:
+            engine.confirm(order_id, salesman_id)
+            active.append((order_id, city))
+        else:
+            engine.wait(order_id, city)
+        pending_peak = max(pending_peak, engine.pending())
+
+        # once the fleet is at the target utilization every order is matched by a delivery somewhere,
+        # and the freed slot is offered to the orders waiting in that city
+        while len(active) > in_flight:
+            index = random.randrange(len(active))
+            active[index], active[-1] = active[-1], active[index]
+            done, done_city = active.pop()
+            if engine.complete(done) is not None and engine.cities[done_city].pending:
+                for waiting, _ in engine.plan_rebalance(done_city):
+                    active.append((waiting, done_city))
+
+        if step and step % args.shift_every == 0:
+            # a shift change: part of one city's riders go offline at once and their orders are rebalanced
+            city = random.choice(cities)
+            riders = list(engine.cities[city].riders.values())
+            leaving = random.sample(riders, int(len(riders) * args.offline_share))
+            began = time.perf_counter()
+            for rider in leaving:
+                engine.set_online(rider.salesman_id, False)
+            changes = engine.plan_rebalance(city)
+            rebalance_ms.append((time.perf_counter() - began) * 1000)
+            moved += len(changes)
+            active = [(order, order_city) for order, order_city in active if order in engine.assigned]
+            active += [(order, city) for order, salesman_id in changes if salesman_id is not None]
+            for rider in random.sample(leaving, len(leaving) // 2):
+                engine.set_online(rider.salesman_id, True)
+    elapsed = time.perf_counter() - started
+
+    assign_ns.sort()
+    print(f"{args.orders} orders across {args.cities} cities, {len(engine.riders)} riders, strategy {args.strategy}, simulated in {elapsed:.1f}s")
+    print(f"assign p50 {percentile(assign_ns, 50) / 1000:.1f} us  p99 {percentile(assign_ns, 99) / 1000:.1f} us  max {assign_ns[-1] / 1000:.1f} us")
+    if rebalance_ms:
+        print(f"{len(rebalance_ms)} shift changes moved {moved} orders, rebalance p50 {statistics.median(rebalance_ms):.2f} ms  max {max(rebalance_ms):.2f} ms")
+    print(f"pending orders peak {pending_peak}, now {engine.pending()}")
+
+    online = [rider for rider in engine.riders.values() if rider.online]
+    loads = [rider.load for rider in online]
+    print(f"load across online riders: mean {statistics.mean(loads):.2f}  stdev {statistics.pstdev(loads):.2f}  max {max(loads)}")
+    assert all(rider.load == len(rider.orders) <= args.max_load for rider in engine.riders.values())
+    assert not any(rider.orders for rider in engine.riders.values() if not rider.online)
+    assert len(engine.assigned) == sum(loads)
+
+    busiest = max(engine.cities.values(), key=lambda index: len(index.riders))
+    riders = list(busiest.riders.values())
+    began = time.perf_counter_ns()
+    for _ in range(args.baseline_rounds):
+        linear_assign(riders, args.max_load)
+    linear = (time.perf_counter_ns() - began) / args.baseline_rounds
+    print(f"linear scan over {len(riders)} riders: {linear / 1000:.1f} us per assignment, {linear / max(percentile(assign_ns, 50), 1):.0f}x the heap's p50")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate order dispatch across cities with shift changes, in memory")
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--cities", type=int, default=25)
+    parser.add_argument("--riders", type=int, default=10000, help="riders across all cities")
+    parser.add_argument("--max-load", type=int, default=5)
+    parser.add_argument("--strategy", choices=("load", "cost"), default="load")
+    parser.add_argument("--utilization", type=float, default=0.7, help="share of the fleet's capacity kept busy")
+    parser.add_argument("--shift-every", type=int, default=5000)
+    parser.add_argument("--offline-share", type=float, default=0.2)
+    parser.add_argument("--baseline-rounds", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    simulate(parser.parse_args())
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "login_scaling.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from users_app import models
+from users_app.crud import authenticate_user, get_lookup_key, get_password_hash
+from users_app.database import AsyncSessionLocal, SessionLocal, engine
+
+PASSWORD = "benchmark-password"
+USER_COUNTS = [100, 1000, 10000, 50000]
+SAMPLES = 20
+
+
+def seed(db, start: int, stop: int, hashed_password: str):
+    users = []
+    passwords = []
+    for i in range(start, stop):
+        salt = f"salt-{i}"
+        special_key = f"user{i}@bench.local"
+        users.append(dict(
+            full_name=f"User {i}", email=f"user{i}@bench.local", phone="+8801000000000",
+            division="Dhaka", district="Dhaka", address="Bench", photo_url="",
+            salt=salt, special_key=special_key,
+        ))
+        passwords.append(dict(
+            hashed_key=f"bench-{i}", lookup_key=get_lookup_key(salt + special_key), hashed_password=hashed_password,
+        ))
+    db.bulk_insert_mappings(models.User, users)
+    db.bulk_insert_mappings(models.Password, passwords)
+    db.commit()
+
+
+async def measure(count: int):
+    timings = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(SAMPLES):
+            email = f"user{random.randrange(count)}@bench.local"
+            started = time.perf_counter()
+            assert await authenticate_user(email, PASSWORD, db)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    models.Base.metadata.create_all(bind=engine)
+    hashed_password = get_password_hash(PASSWORD)
+    db = SessionLocal()
+    seeded = 0
+    print(f"{'users':>8} {'p50 ms':>10} {'p95 ms':>10}")
+    try:
+        for count in USER_COUNTS:
+            seed(db, seeded, count, hashed_password)
+            seeded = count
+            p50, p95 = asyncio.run(measure(count))
+            print(f"{count:>8} {p50:>10.1f} {p95:>10.1f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
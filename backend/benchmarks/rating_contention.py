@@ -0,0 +1,68 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "rating_contention.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from users_app import models
+from users_app.crud import rate_food
+from users_app.database import AsyncSessionLocal, engine
+
+# sqlite serializes writers and gives up after its 5s busy timeout, point SQLALCHEMY_DB_URI at MySQL for more
+RATERS = 20
+RATINGS_PER_RATER = 20
+FOODS = 3
+
+
+async def rater(food_ids, ratings):
+    async with AsyncSessionLocal() as db:
+        for food_id, rating in zip(food_ids, ratings):
+            await rate_food(db, food_id, rating)
+
+
+async def main():
+    models.Base.metadata.create_all(bind=engine)
+    async with AsyncSessionLocal() as db:
+        db.add(models.District(id=1, name="Dhaka", image_url=""))
+        db.add(models.Restaurant(id=1, restaurant_name="Bench", restaurant_address="", cover_photo="", ratings=0, number_of_raters=0, district_id=1))
+        db.add_all([models.Food(id=i, food_name=f"Food {i}", food_image="", price=100, ratings=0, number_of_raters=0, restaurant_id=1) for i in range(1, FOODS + 1)])
+        await db.commit()
+
+    plans = []
+    for _ in range(RATERS):
+        food_ids = [random.randint(1, FOODS) for _ in range(RATINGS_PER_RATER)]
+        ratings = [random.randint(1, 5) for _ in range(RATINGS_PER_RATER)]
+        plans.append((food_ids, ratings))
+    started = time.perf_counter()
+    await asyncio.gather(*(rater(food_ids, ratings) for food_ids, ratings in plans))
+    elapsed = time.perf_counter() - started
+
+    expected = {}
+    for food_ids, ratings in plans:
+        for food_id, rating in zip(food_ids, ratings):
+            expected.setdefault(food_id, []).append(rating)
+    async with AsyncSessionLocal() as db:
+        for food_id, submitted in sorted(expected.items()):
+            food = await db.get(models.Food, food_id)
+            assert food.number_of_raters == len(submitted), (food_id, food.number_of_raters, len(submitted))
+            assert abs(food.ratings - sum(submitted) / len(submitted)) < 1e-6, (food_id, food.ratings)
+        restaurant = await db.get(models.Restaurant, 1)
+        every = [rating for _, ratings in plans for rating in ratings]
+        assert restaurant.number_of_raters == len(every)
+        assert abs(restaurant.ratings - sum(every) / len(every)) < 1e-6
+    total = RATERS * RATINGS_PER_RATER
+    print(f"{total} ratings from {RATERS} concurrent raters in {elapsed:.2f}s ({total / elapsed:.0f}/s), aggregates exact")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
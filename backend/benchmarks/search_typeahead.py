@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SQLALCHEMY_DB_URI", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from users_app import models
+from users_app.ratings import weighted_score
+from users_app.search import CatalogueSearch
+
+FOODS = 100_000
+RESTAURANTS = 2_000
+QUERIES = 2_000
+DISHES = ["Chicken Biryani", "Beef Bhuna", "Fish Curry", "Mutton Rezala", "Prawn Malai Curry", "Vegetable Khichuri",
+          "Chicken Tikka", "Beef Kala Bhuna", "Hilsa Paturi", "Shorshe Ilish", "Dal Makhani", "Plain Naan", "Garlic Naan",
+          "Fuchka", "Chotpoti", "Haleem", "Kacchi Biryani", "Morog Polao", "Shahi Tukra", "Mishti Doi"]
+STYLES = ["Special", "Deluxe", "Classic", "Spicy", "Family", "Combo", "Platter", "Mini", "Royal", "Dhakai"]
+
+
+def build():
+    index = CatalogueSearch()
+    for i in range(1, RESTAURANTS + 1):
+        ratings, number_of_raters = random.uniform(0, 5), random.randrange(500)
+        index.add_restaurant(models.Restaurant(
+            id=i, restaurant_name=f"Kitchen {i}", restaurant_address=f"Road {i % 50}, Dhaka", cover_photo="",
+            ratings=ratings, number_of_raters=number_of_raters, score=weighted_score(ratings, number_of_raters), district_id=i % 64 + 1,
+        ))
+    for i in range(1, FOODS + 1):
+        ratings, number_of_raters = random.uniform(0, 5), random.randrange(500)
+        index.add_food(models.Food(
+            id=i, food_name=f"{random.choice(STYLES)} {random.choice(DISHES)} {i % 997}", food_image="",
+            price=random.randrange(50, 1500), ratings=ratings, number_of_raters=number_of_raters,
+            score=weighted_score(ratings, number_of_raters), restaurant_id=random.randrange(1, RESTAURANTS + 1),
+        ))
+    return index
+
+
+def main():
+    started = time.perf_counter()
+    index = build()
+    print(f"indexed {FOODS} foods in {time.perf_counter() - started:.1f}s")
+    words = [word.lower() for dish in DISHES + STYLES for word in dish.split()]
+    timings = []
+    for _ in range(QUERIES):
+        word = random.choice(words)
+        query = word[:random.randrange(2, len(word) + 1)]
+        if random.random() < 0.5:
+            query = f"{random.choice(words)} {query}"
+        started = time.perf_counter()
+        index.search_foods(query, district_id=random.choice([None, random.randrange(1, 65)]), limit=10)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    for p in (50, 95, 99):
+        print(f"p{p}: {timings[int(len(timings) * p / 100) - 1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "serialization.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from users_app import models, schemas
+from users_app.crud import get_all_food
+from users_app.database import AsyncSessionLocal, engine
+from users_app.serialization import food_rows
+
+ROWS = 1000
+ROUNDS = 200
+food_list = TypeAdapter(list[schemas.Food])
+
+
+def seed():
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.District.__table__.insert(), [{"id": 1, "name": "Dhaka", "image_url": ""}])
+        conn.execute(models.Restaurant.__table__.insert(), [
+            {"id": 1, "restaurant_name": "Bench", "restaurant_address": "", "cover_photo": "", "ratings": 0, "number_of_raters": 0, "score": 0, "district_id": 1}
+        ])
+        conn.execute(models.Food.__table__.insert(), [
+            {"food_name": f"Dish {i}", "food_image": f"https://img.example/{i}.jpg", "price": random.randrange(100, 900),
+             "ratings": random.uniform(1, 5), "number_of_raters": random.randrange(500), "score": random.uniform(1, 5), "restaurant_id": 1}
+            for i in range(ROWS)
+        ])
+
+
+async def orm_response(db):
+    foods = (await db.scalars(select(models.Food).limit(ROWS))).all()
+    return food_list.dump_json(food_list.validate_python(foods, from_attributes=True))
+
+async def row_response(db, layout="rows"):
+    return food_rows.encode(await get_all_food(db, 0, ROWS), layout)
+
+
+async def measure(name, respond, baseline=None):
+    async with AsyncSessionLocal() as db:
+        body = await respond(db)
+        started = time.process_time()
+        for _ in range(ROUNDS):
+            await respond(db)
+            # a fresh identity map each round, as a new request would have
+            db.expunge_all()
+        per_response = (time.process_time() - started) / ROUNDS * 1000
+    saved = f"  ({(1 - per_response / baseline) * 100:.0f}% less CPU)" if baseline else ""
+    print(f"{name:<28} {per_response:7.2f} ms CPU per {ROWS}-row response, {len(body) / 1024:6.1f} KiB{saved}")
+    return per_response, body
+
+
+async def main():
+    seed()
+    baseline, orm_body = await measure("orm + pydantic", orm_response)
+    _, fast_body = await measure("column tuples + orjson", row_response, baseline)
+    await measure("columnar + orjson", lambda db: row_response(db, "columns"), baseline)
+    assert food_list.validate_json(fast_body) == food_list.validate_json(orm_body)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "stock_rush.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "benchmark-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from users_app import models, schemas
+from users_app.crud import create_order
+from users_app.database import AsyncSessionLocal, engine
+from users_app.stock import recover, stock_levels
+
+
+def seed(foods: int, stock: int):
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.District.__table__.insert(), [{"id": 1, "name": "Dhaka", "image_url": ""}])
+        conn.execute(models.Restaurant.__table__.insert(), [
+            {"id": 1, "restaurant_name": "Kitchen", "restaurant_address": "", "cover_photo": "", "ratings": 0, "number_of_raters": 0, "score": 0, "district_id": 1}
+        ])
+        conn.execute(models.Food.__table__.insert(), [
+            {"id": f, "food_name": f"Dish {f}", "food_image": "", "price": 100, "ratings": 0, "number_of_raters": 0, "score": 0, "restaurant_id": 1, "stock": stock}
+            for f in range(1, foods + 1)
+        ])
+        conn.execute(models.Customer.__table__.insert(), [{"customer_id": 1, "cust_name": "Customer", "city": "Dhaka", "grade": 1}])
+
+
+async def place(order: schemas.OrderCreate, limit: asyncio.Semaphore, outcome: dict):
+    async with limit:
+        async with AsyncSessionLocal() as db:
+            try:
+                await create_order(db, order)
+                outcome["placed"] += 1
+            except HTTPException:
+                outcome["sold_out"] += 1
+
+
+async def sold_per_food(db):
+    stmt = select(models.Order.food_id, func.sum(models.Order.quantity)).group_by(models.Order.food_id)
+    return dict((await db.execute(stmt)).all())
+
+
+async def rush(args):
+    seed(args.foods, args.stock)
+    await stock_levels.ensure_loaded()
+    limit = asyncio.Semaphore(args.concurrency)
+    outcome = {"placed": 0, "sold_out": 0}
+    orders = [
+        schemas.OrderCreate(customer_id=1, food_id=random.randint(1, args.foods), quantity=random.randint(1, 3))
+        for _ in range(args.orders)
+    ]
+    half = len(orders) // 2
+    started = time.perf_counter()
+    await asyncio.gather(*(place(order, limit, outcome) for order in orders[:half]))
+    await stock_levels.flush()
+    # the second half is never flushed, as if the process died right after it
+    await asyncio.gather(*(place(order, limit, outcome) for order in orders[half:]))
+    elapsed = time.perf_counter() - started
+
+    async with AsyncSessionLocal() as db:
+        sold = await sold_per_food(db)
+        recovered = await recover(db)
+    await stock_levels.stop()
+    async with AsyncSessionLocal() as db:
+        flushed = await recover(db)
+    oversold = {food_id: quantity for food_id, quantity in sold.items() if quantity > args.stock}
+    expected = {food_id: args.stock - sold.get(food_id, 0) for food_id in range(1, args.foods + 1)}
+    print(f"{outcome['placed']} orders placed, {outcome['sold_out']} turned away as sold out in {elapsed:.1f}s = {args.orders / elapsed * 60:.0f} attempts/min")
+    print(f"oversold foods: {len(oversold)}, sold out foods: {sum(1 for remaining in stock_levels.remaining.values() if remaining == 0)}/{args.foods}")
+    print(f"counters match orders in memory: {stock_levels.remaining == expected}, "
+          f"recovered after a crash: {recovered == expected}, after a clean shutdown: {flushed == expected}")
+    assert not oversold and stock_levels.remaining == expected == recovered == flushed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Oversubscribe stock-tracked foods with concurrent orders and check nothing is oversold")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--foods", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(rush(parser.parse_args()))
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import sys
+import tempfile
+from collections.abc import Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "tests.db")
+os.environ.setdefault("SQLALCHEMY_DB_URI", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("PASSWORD_LOOKUP_KEY", "test-lookup-key")
+os.environ.setdefault("TOKEN_ALGORITHM", "HS256")
+os.environ.setdefault("HASH_ALGORITHM", "bcrypt")
+os.environ.setdefault("ACCOUNT_SID", "test")
+os.environ.setdefault("AUTH_TOKEN", "test")
+os.environ.setdefault("OTP_TRANSPORT", "fake")
+# stock is flushed when a test asks for it, not by the background task halfway through
+os.environ.setdefault("STOCK_FLUSH_SECONDS", "3600")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from users_app import models
+from users_app.cache import catalogue_cache
+from users_app.crud import principal_cache
+from users_app.database import async_engine, engine
+from users_app.dispatch import dispatcher
+from users_app.kitchen import kitchen
+from users_app.ranking import rankings
+from users_app.ratings import weighted_score
+from users_app.stock import stock_levels
+
+
+@pytest.fixture(autouse=True)
+def database():
+    # every test starts from empty tables and from in-process state that has never seen a loop
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    catalogue_cache.invalidate()
+    principal_cache.clear()
+    for singleton in (stock_levels, dispatcher, kitchen, rankings):
+        singleton.__init__()
+    yield engine
+
+
+@pytest.fixture
+def insert(database):
+    def insert(model, rows: list[dict]):
+        with database.begin() as conn:
+            conn.execute(model.__table__.insert(), rows)
+    return insert
+
+
+@pytest.fixture
+def catalogue(insert):
+    # districts[i] restaurants in district i + 1 and menus[j] foods in restaurant j + 1, ids counting
+    # up from 1 and nothing rated yet. Returns the food ids of each restaurant.
+    def catalogue(districts: Sequence[int] = (1,), menus: Sequence[int] = (1,), stock: int | None = None, price: float = 100):
+        district_ids = range(1, len(districts) + 1)
+        insert(models.District, [{"id": district_id, "name": f"District {district_id}", "image_url": ""} for district_id in district_ids])
+        restaurants = [district_id for district_id, count in zip(district_ids, districts) for _ in range(count)]
+        insert(models.Restaurant, [
+            {"id": restaurant_id, "restaurant_name": f"Restaurant {restaurant_id}", "restaurant_address": "", "cover_photo": "",
+             "ratings": 0, "number_of_raters": 0, "score": weighted_score(0, 0), "district_id": district_id}
+            for restaurant_id, district_id in enumerate(restaurants, start=1)
+        ])
+        foods, food_id = {}, 0
+        for restaurant_id, count in enumerate(menus, start=1):
+            foods[restaurant_id] = list(range(food_id + 1, food_id + count + 1))
+            food_id += count
+        insert(models.Food, [
+            {"id": food_id, "food_name": f"Dish {food_id}", "food_image": "", "price": price, "ratings": 0,
+             "number_of_raters": 0, "score": weighted_score(0, 0), "restaurant_id": restaurant_id, "stock": stock}
+            for restaurant_id, food_ids in foods.items() for food_id in food_ids
+        ])
+        return foods
+    return catalogue
+
+
+@pytest.fixture
+def fleet(catalogue, insert):
+    # riders 1 and 2 in Dhaka, 2 the cheaper, rider 3 in Sylhet, customer 1 in Dhaka and 2 in Sylhet
+    catalogue(menus=[1])
+    insert(models.Salesman, [
+        {"salesman_id": 1, "name": "Rider 1", "city": "Dhaka", "commission": 0.1},
+        {"salesman_id": 2, "name": "Rider 2", "city": "Dhaka", "commission": 0.05},
+        {"salesman_id": 3, "name": "Rider 3", "city": "Sylhet", "commission": 0.1},
+    ])
+    insert(models.Customer, [
+        {"customer_id": 1, "cust_name": "Dhaka customer", "city": "Dhaka", "grade": 1},
+        {"customer_id": 2, "cust_name": "Sylhet customer", "city": "Sylhet", "grade": 1},
+    ])
+
+
+@pytest.fixture
+def run():
+    # each test gets its own loop, so pooled connections opened on it are closed with it
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await stock_levels.stop()
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def client():
+    from users_app.main import app
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,86 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+
+from users_app import models, schemas
+from users_app.analytics import revenue_by_day, top_salesmen
+from users_app.crud import create_order, set_rider_online
+from users_app.database import AsyncSessionLocal
+
+DHAKA, SYLHET = 1, 2
+START, END = date(2000, 1, 1), date(2100, 1, 1)
+
+
+async def place(*customer_ids: int):
+    async with AsyncSessionLocal() as db:
+        for quantity, customer_id in enumerate(customer_ids, start=1):
+            await create_order(db, schemas.OrderCreate(customer_id=customer_id, food_id=1, quantity=quantity))
+
+
+async def shift(salesman_id: int, online: bool):
+    async with AsyncSessionLocal() as db:
+        await set_rider_online(db, salesman_id, online)
+
+
+async def reports():
+    # what the rollups say next to the same figures aggregated straight from the orders
+    Order, Salesman = models.Order, models.Salesman
+    async with AsyncSessionLocal() as db:
+        by_day = [(day.day, day.orders, day.quantity, day.revenue) for day in await revenue_by_day(db, START, END)]
+        salesmen = [(row.salesman_id, row.orders, row.revenue, pytest.approx(row.commission)) for row in await top_salesmen(db, START, END)]
+        raw_by_day = (await db.execute(
+            select(Order.ord_date, func.count(Order.id), func.sum(Order.quantity), func.sum(Order.amount)).group_by(Order.ord_date)
+        )).all()
+        raw_salesmen = (await db.execute(
+            select(Order.salesman_id, func.count(Order.id), func.sum(Order.amount), func.sum(Order.amount * Salesman.commission))
+            .join(Salesman, Salesman.salesman_id == Order.salesman_id)
+            .group_by(Order.salesman_id)
+            .order_by(func.sum(Order.amount).desc(), Order.salesman_id)
+        )).all()
+    return by_day, [tuple(row) for row in raw_by_day], salesmen, [tuple(row) for row in raw_salesmen]
+
+
+def assert_rollups_match(by_day, raw_by_day, salesmen, raw_salesmen):
+    assert by_day == raw_by_day
+    assert salesmen == raw_salesmen
+
+
+def test_rollups_follow_orders_moved_between_riders(fleet, run):
+    async def shifts():
+        await place(DHAKA, DHAKA, DHAKA, SYLHET, DHAKA)
+        placed = await reports()
+        # rider 2 leaves and rider 1 takes its orders, then rider 1 leaves too and they all wait
+        await shift(2, False)
+        handed_over = await reports()
+        await shift(1, False)
+        waiting = await reports()
+        await shift(2, True)
+        return placed, handed_over, waiting, await reports()
+    placed, handed_over, waiting, back = run(shifts())
+
+    for report in (placed, handed_over, waiting, back):
+        assert_rollups_match(*report)
+    assert [salesman_id for salesman_id, *_ in handed_over[2]] == [1, 3]
+    assert [salesman_id for salesman_id, *_ in waiting[2]] == [3]
+    assert [salesman_id for salesman_id, *_ in back[2]] == [2, 3]
+
+
+def test_moving_orders_missing_from_the_rollups_leaves_no_negative_rows(fleet, insert, run):
+    # orders from before rollups were kept, assigned to rider 2
+    insert(models.Order, [
+        {"id": order_id, "quantity": 1, "ord_date": date(2024, 1, 1), "customer_id": DHAKA, "salesman_id": 2,
+         "food_id": 1, "restaurant_id": 1, "amount": 100, "status": "queued"}
+        for order_id in (1, 2)
+    ])
+
+    async def hand_over():
+        await shift(2, False)
+        async with AsyncSessionLocal() as db:
+            rollups = (await db.execute(select(models.OrderDailyRollup.__table__))).all()
+            stored = dict((await db.execute(select(models.Order.id, models.Order.salesman_id))).all())
+        return rollups, stored
+    rollups, stored = run(hand_over())
+
+    assert stored == {1: 1, 2: 1}
+    assert rollups == []
@@ -0,0 +1,35 @@
+import os
+
+from starlette.requests import Request
+
+from users_app import cache
+from users_app.cache import cached_response, catalogue_cache
+from users_app.database import ReplicaRouter
+
+
+def get(path: str):
+    return Request({"type": "http", "method": "GET", "path": path, "headers": []})
+
+
+def test_replica_reads_are_not_cached_right_after_a_catalogue_write(monkeypatch, run):
+    router = ReplicaRouter([os.environ["SQLALCHEMY_DB_URI"]], pin_seconds=60)
+    monkeypatch.setattr(cache, "replicas", router)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return b"[]"
+
+    async def read_twice():
+        for _ in range(2):
+            response = await cached_response(get("/api/v1/food/"), "food:rows", load)
+            assert response.body == b"[]"
+
+    router.written()
+    run(read_twice())
+    assert len(loads) == 2 and catalogue_cache.get("food:rows") is None
+
+    # reads pinned to the primary, or once the window has passed, fill the cache again
+    router.pin()
+    run(read_twice())
+    assert len(loads) == 3 and catalogue_cache.get("food:rows") is not None
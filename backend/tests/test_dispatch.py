@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import select
+
+from users_app import models, schemas
+from users_app.crud import create_order, deliver_order, set_rider_online
+from users_app.database import AsyncSessionLocal
+from users_app.dispatch import DispatchEngine, dispatcher
+from users_app.kitchen import kitchen
+
+DHAKA, SYLHET = 1, 2
+
+
+async def place(*customer_ids: int):
+    async with AsyncSessionLocal() as db:
+        return [(await create_order(db, schemas.OrderCreate(customer_id=customer_id, food_id=1, quantity=1))).id for customer_id in customer_ids]
+
+
+async def stored_salesmen():
+    async with AsyncSessionLocal() as db:
+        return dict((await db.execute(select(models.Order.id, models.Order.salesman_id))).all())
+
+
+def loads():
+    return {salesman_id: rider.load for salesman_id, rider in dispatcher.riders.items()}
+
+
+def test_orders_go_to_the_least_loaded_rider_in_their_city(fleet, run):
+    async def rush():
+        return await place(DHAKA, DHAKA, DHAKA, SYLHET), await stored_salesmen()
+    order_ids, stored = run(rush())
+
+    # ties on load go to the cheaper commission, riders never leave their city
+    assert [stored[order_id] for order_id in order_ids] == [2, 1, 2, 3]
+    assert loads() == {1: 1, 2: 2, 3: 1}
+
+
+def test_a_delivery_frees_the_rider_for_the_oldest_waiting_order(fleet, run):
+    dispatcher.max_load = 1
+
+    async def deliver_first():
+        order_ids = await place(DHAKA, DHAKA, DHAKA)
+        waiting = await stored_salesmen()
+        async with AsyncSessionLocal() as db:
+            await kitchen.next_batch(db, 1, size=3)
+            await deliver_order(db, order_ids[0])
+        return order_ids, waiting, await stored_salesmen()
+    order_ids, waiting, stored = run(deliver_first())
+
+    assert waiting[order_ids[2]] is None and dispatcher.pending() == 0
+    assert stored[order_ids[2]] == stored[order_ids[0]] == 2
+    assert loads() == {1: 1, 2: 1, 3: 0}
+
+
+def test_a_rider_coming_online_picks_up_waiting_orders(fleet, run):
+    async def shift_change():
+        async with AsyncSessionLocal() as db:
+            for salesman_id in (1, 2):
+                await set_rider_online(db, salesman_id, False)
+        order_ids = await place(DHAKA, DHAKA)
+        waiting = dispatcher.pending()
+        async with AsyncSessionLocal() as db:
+            report = await set_rider_online(db, 1, True)
+        return order_ids, waiting, report, await stored_salesmen()
+    order_ids, waiting, report, stored = run(shift_change())
+
+    assert waiting == 2
+    assert report.moved == 2 and report.status.pending_orders == 0
+    assert [stored[order_id] for order_id in order_ids] == [1, 1]
+    assert loads() == {1: 2, 2: 0, 3: 0}
+
+
+def test_ensure_loaded_rebuilds_the_same_state(fleet, run):
+    dispatcher.max_load = 1
+
+    async def restart():
+        await place(DHAKA, SYLHET, DHAKA, DHAKA, SYLHET)
+        restarted = DispatchEngine(max_load=1)
+        async with AsyncSessionLocal() as db:
+            await restarted.ensure_loaded(db)
+        return restarted
+    restarted = run(restart())
+
+    assert restarted.assigned == dispatcher.assigned
+    assert {salesman_id: rider.load for salesman_id, rider in restarted.riders.items()} == loads() == {1: 1, 2: 1, 3: 1}
+    assert {city: index.pending for city, index in restarted.cities.items()} == {city: index.pending for city, index in dispatcher.cities.items()}
+    assert restarted.pending() == 2
+
+
+def test_a_rebalance_that_fails_to_write_hands_the_orders_back(fleet, run, monkeypatch):
+    from users_app import dispatch
+
+    async def broken(db, moves):
+        raise RuntimeError("database went away")
+
+    async def fail_shift_change():
+        async with AsyncSessionLocal() as db:
+            for salesman_id in (1, 2):
+                await set_rider_online(db, salesman_id, False)
+        order_ids = await place(DHAKA, DHAKA)
+        monkeypatch.setattr(dispatch, "reassign_orders", broken)
+        async with AsyncSessionLocal() as db:
+            with pytest.raises(RuntimeError):
+                await set_rider_online(db, 1, True)
+        return order_ids, await stored_salesmen()
+    order_ids, stored = run(fail_shift_change())
+
+    # rider 1 is back online but nothing was written, so the orders still wait in their old order
+    assert list(dispatcher.cities["Dhaka"].pending.items()) == [(order_id, None) for order_id in order_ids]
+    assert [stored[order_id] for order_id in order_ids] == [None, None]
+    assert dispatcher.assigned == {} and loads() == {1: 0, 2: 0, 3: 0}
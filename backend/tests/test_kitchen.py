@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from users_app import models, schemas
+from users_app.crud import create_order
+from users_app.database import AsyncSessionLocal
+from users_app.kitchen import kitchen
+from users_app.migrations import add_order_columns
+
+
+@pytest.fixture
+def orders(catalogue, insert):
+    catalogue(menus=[2])
+    insert(models.Customer, [{"customer_id": 1, "cust_name": "Customer", "city": "District 1", "grade": 1}])
+
+    async def place(count: int):
+        async with AsyncSessionLocal() as db:
+            return [(await create_order(db, schemas.OrderCreate(customer_id=1, food_id=1, quantity=1))).id for _ in range(count)]
+    return place
+
+
+def test_a_batch_whose_update_fails_stays_queued(orders, run):
+    async def fail_then_retry():
+        order_ids = await orders(3)
+        async with AsyncSessionLocal() as db:
+            async def commit():
+                raise RuntimeError("database went away")
+            db.commit = commit
+            with pytest.raises(RuntimeError):
+                await kitchen.next_batch(db, 1, size=2)
+        queued = kitchen.status(1)["queue_depth"]
+        async with AsyncSessionLocal() as db:
+            batch = await kitchen.next_batch(db, 1, size=3)
+        return order_ids, queued, [(order.id, order.status) for order in batch]
+    order_ids, queued, batch = run(fail_then_retry())
+
+    assert queued == 3
+    assert batch == [(order_id, "preparing") for order_id in order_ids]
+
+
+def test_orders_from_before_the_status_column_are_not_queued_again():
+    legacy = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'legacy.db')}")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE orders (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, ord_date DATE NOT NULL, customer_id INTEGER, salesman_id INTEGER)"))
+        conn.execute(text("INSERT INTO orders (quantity, ord_date) VALUES (1, '2024-01-01'), (2, '2024-01-02')"))
+
+    add_order_columns(legacy)
+    with legacy.begin() as conn:
+        conn.execute(text("INSERT INTO orders (quantity, ord_date) VALUES (3, '2026-10-17')"))
+        statuses = conn.execute(text("SELECT id, status FROM orders ORDER BY id")).all()
+
+    assert statuses == [(1, "delivered"), (2, "delivered"), (3, "queued")]
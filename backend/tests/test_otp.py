@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from users_app.otp import FakeTransport, OTPDispatcher
+
+
+class SlowTransport(FakeTransport):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    async def send(self, to: str, body: str):
+        await asyncio.sleep(self.delay)
+        return await super().send(to, body)
+
+
+async def accept_and_stop(transport: SlowTransport, drain_seconds: float):
+    dispatcher = OTPDispatcher(transport, workers=2, rate=1000)
+    for number in range(4):
+        dispatcher.enqueue(f"+88018500000{number}", "Your OTP is 123456")
+    await dispatcher.stop(drain_seconds=drain_seconds)
+    return dispatcher
+
+
+def test_stop_sends_what_was_already_accepted(run):
+    dispatcher = run(accept_and_stop(SlowTransport(0.01), drain_seconds=5))
+
+    assert len(dispatcher.transport.sent) == dispatcher.sent == 4
+    assert dispatcher.stats()["queue_depth"] == 0
+
+
+def test_stop_gives_up_after_the_drain_timeout_and_says_how_many_were_dropped(run, caplog):
+    with caplog.at_level(logging.WARNING, logger="users_app.otp"):
+        dispatcher = run(accept_and_stop(SlowTransport(60), drain_seconds=0.05))
+
+    assert dispatcher.transport.sent == []
+    assert "Shutting down with 4 OTPs unsent (2 queued, 2 sending)" in caplog.text
@@ -0,0 +1,42 @@
+from sqlalchemy import update
+
+from users_app import models, schemas
+from users_app.crud import authenticate_user, create_user
+from users_app.database import AsyncSessionLocal, SessionLocal
+from users_app.migrations import backfill_password_lookup_keys
+
+USERS = 4
+
+
+def signup(number: int):
+    return schemas.UserCreate(
+        full_name=f"User {number}", email=f"user{number}@example.com", phone=f"185000000{number}",
+        division="Dhaka", district="Dhaka", address="", photo_url="", password=f"password {number}",
+    )
+
+
+async def login_all():
+    async with AsyncSessionLocal() as db:
+        return [bool(await authenticate_user(f"user{number}@example.com", f"password {number}", db)) for number in range(USERS)]
+
+
+def test_legacy_rows_are_matched_offline_not_on_login(run, database):
+    async def signup_all():
+        async with AsyncSessionLocal() as db:
+            for number in range(USERS):
+                await create_user(db, signup(number))
+    run(signup_all())
+    # as if every row predated lookup_key
+    with database.begin() as conn:
+        conn.execute(update(models.Password).values(lookup_key=None))
+
+    before = run(login_all())
+    with SessionLocal() as db:
+        matched = backfill_password_lookup_keys(db, workers=2)
+    with SessionLocal() as db:
+        rerun = backfill_password_lookup_keys(db, workers=2)
+    after = run(login_all())
+
+    assert before == [False] * USERS
+    assert matched == USERS and rerun == 0
+    assert after == [True] * USERS
@@ -0,0 +1,28 @@
+from users_app.otp import topt
+
+
+def signup(number: int):
+    return {
+        "full_name": f"User {number}", "email": f"user{number}@example.com", "phone": f"185000000{number}",
+        "division": "Dhaka", "district": "Dhaka", "address": "", "photo_url": "", "password": f"password {number}",
+    }
+
+
+def test_only_verified_users_provision_and_errors_count_rows_from_one(client):
+    assert client.post("/api/v1/users/", json=signup(0)).status_code == 200
+    token = client.post("/api/v1/token/", data={"username": "user0@example.com", "password": "password 0"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    batch = [signup(1), signup(0), signup(2), signup(1)]
+
+    unverified = client.post("/api/v1/users/batch/", headers=headers, json=batch)
+    assert client.post("/api/v1/otp/verify/", headers=headers, json={"otp": topt.now()}).status_code == 200
+    verified = client.post("/api/v1/users/batch/", headers=headers, json=batch)
+
+    assert unverified.status_code == 403
+    assert verified.status_code == 200
+    report = verified.json()
+    assert [user["email"] for user in report["created"]] == ["user1@example.com", "user2@example.com"]
+    assert report["errors"] == [
+        {"row": 2, "error": "Email already registered"},
+        {"row": 4, "error": "Email repeated in batch"},
+    ]
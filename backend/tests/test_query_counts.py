@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import event
+
+from users_app.database import async_engine
+
+
+def count_queries(client, url: str):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+
+def test_menu_query_count_does_not_grow_with_the_menu(catalogue, client):
+    # restaurant 1 has one dish, restaurant 2 has fifty
+    catalogue(districts=[2], menus=[1, 50])
+
+    short, short_menu = count_queries(client, "/api/v1/restaurant/menu/1/")
+    long, long_menu = count_queries(client, "/api/v1/restaurant/menu/2/")
+
+    assert len(short_menu["foods"]) == 1 and len(long_menu["foods"]) == 50
+    assert short == long == 2
+
+
+@pytest.mark.parametrize("url", ["/api/v1/district/{district_id}/restaurants/", "/api/v1/restaurant/{district_id}"])
+def test_district_listing_query_count_does_not_grow_with_the_district(url, catalogue, client):
+    # district 1 has one restaurant, district 2 has forty, each with a few dishes
+    catalogue(districts=[1, 40], menus=[3] * 41)
+
+    small, small_listing = count_queries(client, url.format(district_id=1))
+    large, large_listing = count_queries(client, url.format(district_id=2))
+
+    restaurants = lambda listing: listing["restaurants"] if isinstance(listing, dict) else listing
+    assert len(restaurants(small_listing)) == 1 and len(restaurants(large_listing)) == 40
+    assert small == large
@@ -0,0 +1,61 @@
+import asyncio
+import random
+
+import pytest
+
+from users_app import models
+from users_app.crud import rate_food, rate_restaurant
+from users_app.database import AsyncSessionLocal
+from users_app.ratings import weighted_score
+
+RATERS = 12
+RATINGS_PER_RATER = 10
+
+
+async def rater(plan: list[tuple[int, int]]):
+    async with AsyncSessionLocal() as db:
+        for food_id, rating in plan:
+            await rate_food(db, food_id, rating)
+
+
+async def load(model, item_id: int):
+    async with AsyncSessionLocal() as db:
+        return await db.get(model, item_id)
+
+
+def test_concurrent_ratings_are_all_counted(catalogue, run):
+    catalogue(menus=[3])
+    rng = random.Random(12)
+    plans = [[(rng.randint(1, 3), rng.randint(1, 5)) for _ in range(RATINGS_PER_RATER)] for _ in range(RATERS)]
+
+    async def rate_concurrently():
+        await asyncio.gather(*(rater(plan) for plan in plans))
+        return [await load(models.Food, food_id) for food_id in (1, 2, 3)], await load(models.Restaurant, 1)
+    foods, restaurant = run(rate_concurrently())
+
+    submitted = {}
+    for plan in plans:
+        for food_id, rating in plan:
+            submitted.setdefault(food_id, []).append(rating)
+    for food in foods:
+        ratings = submitted.get(food.id, [])
+        assert food.number_of_raters == len(ratings)
+        assert food.ratings == pytest.approx(sum(ratings) / len(ratings))
+        assert food.score == pytest.approx(weighted_score(sum(ratings) / len(ratings), len(ratings)))
+    every = [rating for plan in plans for _, rating in plan]
+    assert restaurant.number_of_raters == len(every)
+    assert restaurant.ratings == pytest.approx(sum(every) / len(every))
+    assert restaurant.score == pytest.approx(weighted_score(sum(every) / len(every), len(every)))
+
+
+def test_rating_a_missing_item_changes_nothing(catalogue, run):
+    catalogue(menus=[3])
+
+    async def rate_missing():
+        async with AsyncSessionLocal() as db:
+            missing = await rate_food(db, 99, 5), await rate_restaurant(db, 99, 5)
+        return missing, await load(models.Restaurant, 1)
+    missing, restaurant = run(rate_missing())
+
+    assert missing == (None, None)
+    assert restaurant.number_of_raters == 0
@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from users_app import models, schemas
+from users_app.crud import create_order
+from users_app.database import AsyncSessionLocal
+from users_app.stock import StockLevels, stock_levels
+
+FOODS = 4
+STOCK = 30
+
+
+@pytest.fixture
+def menu(catalogue, insert):
+    catalogue(menus=[FOODS], stock=STOCK)
+    insert(models.Customer, [{"customer_id": 1, "cust_name": "Customer", "city": "District 1", "grade": 1}])
+
+
+def random_orders(count: int, seed: int):
+    rng = random.Random(seed)
+    return [schemas.OrderCreate(customer_id=1, food_id=rng.randint(1, FOODS), quantity=rng.randint(1, 3)) for _ in range(count)]
+
+
+async def place_all(orders: list[schemas.OrderCreate]):
+    outcome = {"placed": 0, "sold_out": 0}
+
+    async def place(order):
+        async with AsyncSessionLocal() as db:
+            try:
+                await create_order(db, order)
+                outcome["placed"] += 1
+            except HTTPException as e:
+                assert e.status_code == 409
+                outcome["sold_out"] += 1
+    await asyncio.gather(*(place(order) for order in orders))
+    return outcome
+
+
+async def sold_per_food():
+    async with AsyncSessionLocal() as db:
+        stmt = select(models.Order.food_id, func.sum(models.Order.quantity)).group_by(models.Order.food_id)
+        return dict((await db.execute(stmt)).all())
+
+
+async def restart():
+    # a fresh set of counters recovers from the database like a new process would
+    restarted = StockLevels()
+    await restarted.ensure_loaded()
+    await restarted.stop()
+    return restarted.remaining
+
+
+def test_concurrent_orders_never_oversell(menu, run):
+    orders = random_orders(200, seed=23)
+
+    async def rush():
+        return await place_all(orders), await sold_per_food()
+    outcome, sold = run(rush())
+
+    assert outcome["placed"] + outcome["sold_out"] == len(orders)
+    assert outcome["sold_out"] > 0
+    assert all(quantity <= STOCK for quantity in sold.values())
+    assert stock_levels.remaining == {food_id: STOCK - sold.get(food_id, 0) for food_id in range(1, FOODS + 1)}
+
+
+def test_stock_is_recovered_after_a_flush_and_a_crash(menu, run):
+    orders = random_orders(60, seed=5)
+
+    async def flush_then_crash():
+        await place_all(orders[:30])
+        await stock_levels.flush()
+        # the second half is never flushed, as if the process died right after it
+        await place_all(orders[30:])
+        after_crash = await restart()
+        await stock_levels.stop()
+        return after_crash, await restart(), await sold_per_food()
+    after_crash, after_shutdown, sold = run(flush_then_crash())
+
+    expected = {food_id: STOCK - sold.get(food_id, 0) for food_id in range(1, FOODS + 1)}
+    assert stock_levels.remaining == expected
+    assert after_crash == expected
+    assert after_shutdown == expected
+
+
+def test_a_flush_racing_orders_never_overcounts_on_recovery(menu, run):
+    orders = random_orders(120, seed=9)
+
+    async def flush_during_rush():
+        rush = asyncio.gather(place_all(orders[:60]), place_all(orders[60:]))
+        for _ in range(5):
+            await asyncio.sleep(0)
+            await stock_levels.flush()
+        await rush
+        return await restart(), await sold_per_food()
+    recovered, sold = run(flush_during_rush())
+
+    # orders still in flight during a flush may be counted twice, never missed
+    for food_id in range(1, FOODS + 1):
+        assert recovered[food_id] <= STOCK - sold.get(food_id, 0)
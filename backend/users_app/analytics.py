@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import delete, desc, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+
+from . import models, schemas
+from .database import AsyncSessionLocal
+
+ANALYTICS_INCREMENTAL = config('ANALYTICS_INCREMENTAL', default=True, cast=bool)
+ANALYTICS_DEFAULT_DAYS = config('ANALYTICS_DEFAULT_DAYS', default=30, cast=int)
+
+logger = logging.getLogger(__name__)
+
+KEYS = ("day", "salesman_id", "city", "grade")
+MEASURES = ("orders", "quantity", "revenue", "commission")
+
+
+def upsert_rollup(dialect: str, values: dict):
+    table = models.OrderDailyRollup.__table__
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**values)
+        return stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in MEASURES})
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(table).values(**values)
+    return stmt.on_conflict_do_update(index_elements=list(KEYS), set_={name: table.c[name] + stmt.excluded[name] for name in MEASURES})
+
+async def record_order(db: AsyncSession, order: models.Order, customer: models.Customer):
+    # runs in the placing transaction, so the rollup and the order commit or roll back together
+    if not ANALYTICS_INCREMENTAL:
+        return
+    salesman_id = order.salesman_id or customer.salesman_id or 0
+    salesman = await db.get(models.Salesman, salesman_id) if salesman_id else None
+    revenue = order.amount or 0
+    values = {
+        "day": order.ord_date,
+        "salesman_id": salesman_id,
+        "city": customer.city,
+        "grade": customer.grade,
+        "orders": 1,
+        "quantity": order.quantity,
+        "revenue": revenue,
+        "commission": revenue * salesman.commission if salesman is not None else 0,
+    }
+    await db.execute(upsert_rollup(db.bind.dialect.name, values))
+
+async def reassign_orders(db: AsyncSession, moves: list[tuple[int, int | None]]):
+    # runs in the rebalancing transaction before the orders are updated: each order leaves the
+    # rollup of the salesman it is stored against and joins the new one's, with the commission
+    # worked out as record_order does, so the old salesman gives back what the order earned
+    if not ANALYTICS_INCREMENTAL or not moves:
+        return
+    Order, Customer, Salesman, Rollup = models.Order, models.Customer, models.Salesman, models.OrderDailyRollup
+    new_ids = dict(moves)
+    stmt = (
+        select(Order.id, Order.ord_date, Order.salesman_id, Order.quantity, Order.amount, Customer.city, Customer.grade, Customer.salesman_id)
+        .join(Customer, Customer.customer_id == Order.customer_id)
+        .filter(Order.id.in_(new_ids))
+    )
+    moved = []
+    for order_id, day, stored, quantity, amount, city, grade, default in await db.execute(stmt):
+        old, new = (day, stored or default or 0, city, grade), (day, new_ids[order_id] or default or 0, city, grade)
+        if old != new:
+            moved.append((old, new, quantity, amount or 0))
+    if not moved:
+        return
+
+    # orders placed before rollups were kept have no row to leave, moving them would leave
+    # negative measures behind, so their rollups are left for rebuild_rollups to redo
+    leaving = Counter(old for old, *_ in moved)
+    stmt = (
+        select(Rollup.day, Rollup.salesman_id, Rollup.city, Rollup.grade, Rollup.orders)
+        .filter(Rollup.day.in_({day for day, *_ in leaving}), Rollup.salesman_id.in_({salesman_id for _, salesman_id, *_ in leaving}))
+    )
+    recorded = {tuple(key): orders for *key, orders in await db.execute(stmt)}
+    missing = {key for key, count in leaving.items() if recorded.get(key, 0) < count}
+    if missing:
+        logger.warning("rollups are missing orders on %s, rebuild those days with python -m users_app.analytics", sorted({day.isoformat() for day, *_ in missing}))
+        moved = [move for move in moved if move[0] not in missing]
+
+    salesman_ids = {key[1] for old, new, *_ in moved for key in (old, new) if key[1]}
+    rates = dict((await db.execute(select(Salesman.salesman_id, Salesman.commission).filter(Salesman.salesman_id.in_(salesman_ids)))).all())
+    deltas: dict[tuple, list] = {}
+    for old, new, quantity, revenue in moved:
+        for key, sign in ((old, -1), (new, 1)):
+            measures = deltas.setdefault(key, [0, 0, 0, 0])
+            for i, value in enumerate((1, quantity, revenue, revenue * rates.get(key[1], 0))):
+                measures[i] += sign * value
+    dialect = db.bind.dialect.name
+    for key, measures in deltas.items():
+        if any(measures):
+            await db.execute(upsert_rollup(dialect, dict(zip(KEYS + MEASURES, key + tuple(measures)))))
+    # a rebuild has no row for a salesman left without orders, so neither should the rollups
+    emptied = [key for key, measures in deltas.items() if measures[0] < 0]
+    if emptied:
+        await db.execute(delete(Rollup).filter(
+            Rollup.orders == 0,
+            Rollup.day.in_({day for day, *_ in emptied}),
+            Rollup.salesman_id.in_({salesman_id for _, salesman_id, *_ in emptied}),
+        ))
+
+async def rebuild_rollups(db: AsyncSession, start: date | None = None, end: date | None = None):
+    Order, Customer, Salesman, Rollup = models.Order, models.Customer, models.Salesman, models.OrderDailyRollup
+    salesman_id = func.coalesce(Order.salesman_id, Customer.salesman_id, 0)
+    revenue = func.coalesce(Order.amount, 0)
+    grouped = (
+        select(
+            Order.ord_date, salesman_id, Customer.city, Customer.grade,
+            func.count(Order.id), func.sum(Order.quantity), func.sum(revenue),
+            func.sum(revenue * func.coalesce(Salesman.commission, 0)),
+        )
+        .join(Customer, Customer.customer_id == Order.customer_id)
+        .outerjoin(Salesman, Salesman.salesman_id == salesman_id)
+        .group_by(Order.ord_date, salesman_id, Customer.city, Customer.grade)
+    )
+    cleared = delete(Rollup)
+    if start is not None:
+        grouped = grouped.filter(Order.ord_date >= start)
+        cleared = cleared.filter(Rollup.day >= start)
+    if end is not None:
+        grouped = grouped.filter(Order.ord_date <= end)
+        cleared = cleared.filter(Rollup.day <= end)
+    await db.execute(cleared)
+    result = await db.execute(insert(Rollup).from_select(KEYS + MEASURES, grouped))
+    await db.commit()
+    return result.rowcount
+
+def date_range(start: date | None, end: date | None):
+    end = end or date.today()
+    return start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1), end
+
+
+async def revenue_by_day(db: AsyncSession, start: date, end: date, city: str | None = None, grade: int | None = None):
+    Rollup = models.OrderDailyRollup
+    stmt = (
+        select(Rollup.day, func.sum(Rollup.orders), func.sum(Rollup.quantity), func.sum(Rollup.revenue))
+        .filter(Rollup.day >= start, Rollup.day <= end)
+        .group_by(Rollup.day)
+        .order_by(Rollup.day)
+    )
+    if city is not None:
+        stmt = stmt.filter(Rollup.city == city)
+    if grade is not None:
+        stmt = stmt.filter(Rollup.grade == grade)
+    return [
+        schemas.RevenueDay(day=day, orders=orders, quantity=quantity, revenue=revenue)
+        for day, orders, quantity, revenue in await db.execute(stmt)
+    ]
+
+def salesman_totals(start: date, end: date):
+    Rollup = models.OrderDailyRollup
+    revenue = func.sum(Rollup.revenue).label("revenue")
+    stmt = (
+        select(Rollup.salesman_id, models.Salesman.name, func.sum(Rollup.orders), revenue, func.sum(Rollup.commission))
+        .join(models.Salesman, models.Salesman.salesman_id == Rollup.salesman_id)
+        .filter(Rollup.day >= start, Rollup.day <= end)
+        .group_by(Rollup.salesman_id, models.Salesman.name)
+    )
+    return stmt, revenue
+
+async def salesman_report(db: AsyncSession, stmt):
+    return [
+        schemas.SalesmanReport(salesman_id=salesman_id, name=name, orders=orders, revenue=revenue, commission=commission)
+        for salesman_id, name, orders, revenue, commission in await db.execute(stmt)
+    ]
+
+async def top_salesmen(db: AsyncSession, start: date, end: date, limit: int = 10):
+    stmt, revenue = salesman_totals(start, end)
+    return await salesman_report(db, stmt.order_by(desc(revenue), models.OrderDailyRollup.salesman_id).limit(limit))
+
+async def commission_payable(db: AsyncSession, start: date, end: date):
+    stmt, _ = salesman_totals(start, end)
+    return await salesman_report(db, stmt.order_by(models.OrderDailyRollup.salesman_id))
+
+
+async def main(start: date | None, end: date | None):
+    async with AsyncSessionLocal() as db:
+        rows = await rebuild_rollups(db, start, end)
+    print(f"rebuilt {rows} rollup rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily order rollups from the orders table")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    args = parser.parse_args()
+    asyncio.run(main(args.start, args.end))
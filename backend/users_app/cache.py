@@ -0,0 +1,115 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from hashlib import blake2b
+from importlib import import_module
+from threading import Lock
+
+from fastapi import Request, Response, status
+from decouple import config
+
+from .database import replicas
+
+CATALOGUE_CACHE_BACKEND = config('CATALOGUE_CACHE_BACKEND', default='users_app.cache.InMemoryCatalogueCache')
+CATALOGUE_CACHE_SIZE = config('CATALOGUE_CACHE_SIZE', default=1024, cast=int)
+CATALOGUE_CACHE_TTL_SECONDS = config('CATALOGUE_CACHE_TTL_SECONDS', default=600, cast=int)
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CatalogueCacheBackend(ABC):
+    # entries are (etag, json bytes); a shared backend only needs to implement these three
+    @abstractmethod
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: tuple[str, bytes]):
+        ...
+
+    @abstractmethod
+    def invalidate(self, prefix: str = ""):
+        ...
+
+
+class InMemoryCatalogueCache(CatalogueCacheBackend):
+    def __init__(self, maxsize: int = CATALOGUE_CACHE_SIZE, ttl: float = CATALOGUE_CACHE_TTL_SECONDS):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str):
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: tuple[str, bytes]):
+        self._entries.set(key, entry)
+
+    def invalidate(self, prefix: str = ""):
+        for key in self._entries.keys():
+            if key.startswith(prefix):
+                self._entries.pop(key)
+
+
+def load_backend(path: str = CATALOGUE_CACHE_BACKEND) -> CatalogueCacheBackend:
+    module, name = path.rsplit(".", 1)
+    return getattr(import_module(module), name)()
+
+
+catalogue_cache = load_backend()
+
+
+def make_etag(body: bytes):
+    return '"' + blake2b(body, digest_size=16).hexdigest() + '"'
+
+async def cached_response(request: Request, key: str, load):
+    entry = catalogue_cache.get(key)
+    if entry is None:
+        body = await load()
+        entry = (make_etag(body), body)
+        # served but not kept while the read may have come from a replica behind the last write
+        if not replicas.lagging():
+            catalogue_cache.set(key, entry)
+    etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
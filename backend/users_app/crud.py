@@ -1,29 +1,64 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import asyncio
+import hmac
+import logging
+from hashlib import sha256
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from decouple import config
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from bcrypt import gensalt
 
 from . import models, schemas
 from .schemas import TokenData
+from .hashing import get_pwd_context, hash_password, verify_password, hashing_service
+from .cache import TTLCache, catalogue_cache
+from .database import replicas
+from .pagination import keyset, make_page
+from .serialization import district_rows, food_rows, restaurant_rows
+from .search import catalogue_search
+from .ranking import rankings
+from .kitchen import kitchen
+from .dispatch import dispatcher
+from .stock import stock_levels
+from .analytics import record_order
+from .ratings import add_rating
 
 SECRET_KEY = config('SECRET_KEY')
+# keys the password lookup HMAC, kept apart from SECRET_KEY so rotating the JWT secret doesn't break logins.
+# While rotating this key, put the old one in PASSWORD_LOOKUP_PREVIOUS_KEY and rows are re-keyed on login.
+PASSWORD_LOOKUP_KEY = config('PASSWORD_LOOKUP_KEY')
+PASSWORD_LOOKUP_PREVIOUS_KEY = config('PASSWORD_LOOKUP_PREVIOUS_KEY', default='')
 ALGORITHM = config('TOKEN_ALGORITHM')
 ACCESS_TOKEN_EXPIRES_MINUTES = 10080
+PROVISION_RETRIES = 3
+PROVISION_MAX_BATCH = config('PROVISION_MAX_BATCH', default=500, cast=int)
+ORDER_PROMISE_MINUTES = config('ORDER_PROMISE_MINUTES', default=45, cast=int)
+TOKEN_EMBED_CLAIMS = config('TOKEN_EMBED_CLAIMS', default=False, cast=bool)
+PRINCIPAL_CACHE_SIZE = config('PRINCIPAL_CACHE_SIZE', default=10000, cast=int)
+PRINCIPAL_CACHE_TTL_SECONDS = config('PRINCIPAL_CACHE_TTL_SECONDS', default=300, cast=int)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/token/")
-pwd_context = CryptContext(schemes=[config('HASH_ALGORITHM')], deprecated="auto")
+# detached User rows keyed by token subject, so authenticated routes skip the users table
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+logger = logging.getLogger(__name__)
 
 
 def varify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+def get_lookup_key(sk: str, key: str = PASSWORD_LOOKUP_KEY):
+    # deterministic, keyed digest of salt + special_key so a password row can be found with one indexed query
+    return hmac.new(key.encode(), sk.encode(), sha256).hexdigest()
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -35,29 +70,62 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, ALGORITHM)
     return encoded_jwt
 
+def get_token_claims(user: models.User):
+    claims = {"sub": user.email}
+    if TOKEN_EMBED_CLAIMS:
+        claims.update({"uid": user.id, "act": user.is_active})
+    return claims
+
+def decode_token(token: str):
+    credentials_exception = HTTPException(
+        status_code = status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        paylod = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_email: str = paylod.get("sub")
+        if user_email is None:
+            raise credentials_exception
+        return TokenData(user_email=user_email, user_id=paylod.get("uid"), is_active=paylod.get("act"))
+    except JWTError:
+        raise credentials_exception
+
+def invalidate_principal(email: str):
+    principal_cache.pop(email)
 
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.User).filter(models.User.id == user_id))
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).filter(models.User.email == email))
 
-def get_pass(db: Session, sk: str):
-    # return db.query(models.Password).filter(pwd_context.verify(sk, models.Password.hashed_key)).first()
-    hashed_keys = db.query(models.Password).all()
-    for hk in hashed_keys:
-        if pwd_context.verify(sk, hk.hashed_key):
-            return hk
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.User).offset(skip).limit(limit))).all()
 
-def create_user(db: Session, user: schemas.UserCreate):
+async def get_pass(db: AsyncSession, sk: str):
+    pw = await db.scalar(select(models.Password).filter(models.Password.lookup_key == get_lookup_key(sk)))
+    if pw is None and PASSWORD_LOOKUP_PREVIOUS_KEY:
+        pw = await get_rekeyed_pass(db=db, sk=sk)
+    return pw
+
+async def get_rekeyed_pass(db: AsyncSession, sk: str):
+    previous = get_lookup_key(sk, PASSWORD_LOOKUP_PREVIOUS_KEY)
+    pw = await db.scalar(select(models.Password).filter(models.Password.lookup_key == previous))
+    if pw is not None:
+        pw.lookup_key = get_lookup_key(sk)
+        await db.commit()
+    return pw
+
+async def hash_user_secrets(user: schemas.UserCreate):
     st = str(gensalt())
     sk = str(user.email) + str(datetime.timestamp(datetime.now()))
-    hashed_password = get_password_hash(user.password)
-    hk=get_password_hash(st + sk)
+    hashed_password, hk = await asyncio.gather(hash_password(user.password), hash_password(st + sk))
+    return st, sk, hashed_password, hk
+
+def build_user(user: schemas.UserCreate, st: str, sk: str, hashed_password: str, hk: str):
     db_user = models.User(
         full_name=user.full_name,
         email=user.email,
@@ -67,75 +135,144 @@ def create_user(db: Session, user: schemas.UserCreate):
         address=user.address,
         photo_url=user.photo_url,
         salt=st,
-        special_key=sk
+        special_key=sk,
+        is_active=False,
         )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
     db_pass = models.Password(
         hashed_key = hk,
+        lookup_key = get_lookup_key(st + sk),
         hashed_password = hashed_password
     )
-    db.add(db_pass)
-    db.commit()
-    db.refresh(db_pass)
+    return db_user, db_pass
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # user and password land in one transaction, the unique email index settles duplicate signups
+    db_user, db_pass = build_user(user, *await hash_user_secrets(user))
+    db.add_all([db_user, db_pass])
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return None
     return db_user
 
-def authenticate_user(email: str, password: str, db: Session):
-    user = get_user_by_email(db=db, email=email)
-    print(user.email)
+async def create_users(db: AsyncSession, users: list[schemas.UserCreate]):
+    errors = []
+    rows = {}
+    for row, user in enumerate(users):
+        # reported rows count from 1 like the catalogue importer's
+        if user.email in rows:
+            errors.append(schemas.ImportRowError(row=row + 1, error="Email repeated in batch"))
+        else:
+            rows[user.email] = row
+
+    async def drop_taken():
+        for email in await db.scalars(select(models.User.email).filter(models.User.email.in_(rows))):
+            errors.append(schemas.ImportRowError(row=rows.pop(email) + 1, error="Email already registered"))
+
+    # a few hashing workers at a time so provisioning doesn't starve interactive logins
+    limit = asyncio.Semaphore(max(1, hashing_service.workers // 2))
+
+    async def hash_secrets(user: schemas.UserCreate):
+        async with limit:
+            return await hash_user_secrets(user)
+
+    await drop_taken()
+    secrets = dict(zip(rows, await asyncio.gather(*(hash_secrets(users[row]) for row in rows.values()))))
+    for _ in range(PROVISION_RETRIES):
+        created = [build_user(users[row], *secrets[email]) for email, row in rows.items()]
+        db.add_all([instance for pair in created for instance in pair])
+        try:
+            await db.commit()
+            break
+        except IntegrityError:
+            # a signup took one of the emails after the check, drop it and insert the rest again
+            await db.rollback()
+            await drop_taken()
+    else:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Batch kept colliding with concurrent signups, try again")
+    errors.sort(key=lambda error: error.row)
+    return [db_user for db_user, _ in created], errors
+
+async def authenticate_user(email: str, password: str, db: AsyncSession):
+    user = await get_user_by_email(db=db, email=email)
     if not user:
          return False
-    pw = get_pass(db=db, sk=user.salt + user.special_key)
-    if not pwd_context.verify(password, pw.hashed_password):
+    logger.debug("authenticating %s", user.email)
+    pw = await get_pass(db=db, sk=user.salt + user.special_key)
+    if pw is None:
+        # rows from before lookup_key are matched offline, never by a bcrypt scan on login
+        logger.warning("no password row for %s, run python -m users_app.migrations", user.email)
+        return False
+    if not await verify_password(password, pw.hashed_password):
         return False
     return user
 
-async def get_current_user(token: str, db: Session):
-    credentials_exception = HTTPException(
-        status_code = status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        paylod = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email: str = paylod.get("sub")
-        if user_email is None:
-            raise credentials_exception
-        token_data = TokenData(user_email=user_email)
-    except JWTError:
-        raise credentials_exception
-    user = get_user_by_email(db=db, email=token_data.user_email)
+async def get_current_user(token: str, db: AsyncSession):
+    token_data = decode_token(token)
+    user = principal_cache.get(token_data.user_email)
+    if user is not None:
+        return user
+    user = await get_user_by_email(db=db, email=token_data.user_email)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code = status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    db.expunge(user)
+    principal_cache.set(token_data.user_email, user)
     return user
 
-async def set_active(token: str, db: Session):
-    user = await get_current_user(token=token, db=db)
-    print(user.email)
-    print(user.is_active)
+async def set_active(token: str, db: AsyncSession):
+    # cached principals are detached, so the update goes through a fresh row
+    user = await get_user_by_email(db=db, email=decode_token(token).user_email)
     if user:
         user.is_active = True
-        db.commit()
-        print(user.is_active)
+        await db.commit()
+        invalidate_principal(user.email)
+        logger.debug("activated %s", user.email)
         return user
     return False
 
 
-async def get_all_district(db: Session, skip: int = 0, limit: int = 64):
-    return db.query(models.District).offset(skip).limit(limit).all()
+def food_changed(db_food: models.Food):
+    # keep every in-process copy of the catalogue in step with a committed write
+    replicas.written()
+    catalogue_cache.invalidate("food")
+    catalogue_search.add_food(db_food)
+    rankings.update_food(db_food)
+
+def restaurant_changed(db_restaurant: models.Restaurant):
+    replicas.written()
+    catalogue_cache.invalidate("restaurant")
+    catalogue_search.add_restaurant(db_restaurant)
+    rankings.update_restaurant(db_restaurant)
+
+
+async def get_all_district(db: AsyncSession, skip: int = 0, limit: int = 64):
+    return (await db.execute(district_rows.select().offset(skip).limit(limit))).all()
+
+async def get_district_with_restaurants(db: AsyncSession, district_id: int):
+    # two queries however many restaurants the district has
+    stmt = select(models.District).options(selectinload(models.District.restaurants)).filter(models.District.id == district_id)
+    return await db.scalar(stmt)
 
-async def get_district_by_name(db: Session, name: str):
-    return db.query(models.District).filter(models.District.name == name).first()
+async def get_district_by_name(db: AsyncSession, name: str):
+    return await db.scalar(select(models.District).filter(models.District.name == name))
 
 
-async def get_all_food(db: Session, skip: int = 0, limit: int = 1000):
-    return db.query(models.Food).offset(skip).limit(limit).all()
+async def get_all_food(db: AsyncSession, skip: int = 0, limit: int = 1000):
+    return (await db.execute(food_rows.select().offset(skip).limit(limit))).all()
 
-async def get_food_by_restaurant(db: Session, restaurant_id: int):
-    return db.query(models.Food).filter(models.Food.restaurant_id == restaurant_id)
+async def get_food_page(db: AsyncSession, after: dict | None = None, sort: str = "id", limit: int = 50):
+    stmt = keyset(select(models.Food), models.Food, after, sort, limit)
+    return make_page(await db.scalars(stmt), sort, limit)
 
-async def create_food(db: Session, food: schemas.FoodCreate):
+async def get_food_by_restaurant(db: AsyncSession, restaurant_id: int):
+    return (await db.execute(food_rows.select().filter(models.Food.restaurant_id == restaurant_id))).all()
+
+async def create_food(db: AsyncSession, food: schemas.FoodCreate):
     db_food = models.Food(
         food_name = food.food_name,
         food_image = food.food_image,
@@ -145,20 +282,32 @@ async def create_food(db: Session, food: schemas.FoodCreate):
         restaurant_id = food.restaurant_id
     )
     db.add(db_food)
-    db.commit()
-    db.refresh(db_food)
+    await db.commit()
+    await db.refresh(db_food)
+    # a new listing must not vanish on the next read, ratings can lag a replica for a moment
+    replicas.pin()
+    food_changed(db_food)
     return db_food
 
-async def get_all_restaurant(db: Session, skip: int = 0, limit: int = 1000):
-    return db.query(models.Restaurant).offset(skip).limit(limit).all()
+async def get_all_restaurant(db: AsyncSession, skip: int = 0, limit: int = 1000):
+    return (await db.execute(restaurant_rows.select().offset(skip).limit(limit))).all()
+
+async def get_restaurant_page(db: AsyncSession, after: dict | None = None, sort: str = "id", limit: int = 50):
+    stmt = keyset(select(models.Restaurant), models.Restaurant, after, sort, limit)
+    return make_page(await db.scalars(stmt), sort, limit)
 
-async def get_restaurant_by_district(db: Session, district_id: int):
-    return db.query(models.Restaurant).filter(models.Restaurant.district_id == district_id)
+async def get_restaurant_by_district(db: AsyncSession, district_id: int):
+    return (await db.execute(restaurant_rows.select().filter(models.Restaurant.district_id == district_id))).all()
 
-async def get_restaurant_by_id(db: Session, restaurant_id: int):
-    return db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+async def get_restaurant_by_id(db: AsyncSession, restaurant_id: int):
+    return await db.scalar(select(models.Restaurant).filter(models.Restaurant.id == restaurant_id))
 
-async def create_restaurant(db: Session, restaurant: schemas.RestaurantCreate):
+async def get_restaurant_with_menu(db: AsyncSession, restaurant_id: int):
+    # two queries however long the menu is
+    stmt = select(models.Restaurant).options(selectinload(models.Restaurant.foods)).filter(models.Restaurant.id == restaurant_id)
+    return await db.scalar(stmt)
+
+async def create_restaurant(db: AsyncSession, restaurant: schemas.RestaurantCreate):
     db_district = await get_district_by_name(db, restaurant.district_id)
     db_restaurant = models.Restaurant(
         restaurant_name = restaurant.restaurant_name,
@@ -169,6 +318,122 @@ async def create_restaurant(db: Session, restaurant: schemas.RestaurantCreate):
         district_id = db_district.id
     )
     db.add(db_restaurant)
-    db.commit()
-    db.refresh(db_restaurant)
-    return db_restaurant
\ No newline at end of file
+    await db.commit()
+    await db.refresh(db_restaurant)
+    replicas.pin()
+    restaurant_changed(db_restaurant)
+    return db_restaurant
+
+async def rate_food(db: AsyncSession, food_id: int, rating: float):
+    # single UPDATEs fold the rating into the running mean, concurrent raters never read-modify-write
+    stmt = update(models.Food).where(models.Food.id == food_id).ordered_values(*add_rating(models.Food, rating))
+    result = await db.execute(stmt.execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        return None
+    restaurant_id = select(models.Food.restaurant_id).where(models.Food.id == food_id).scalar_subquery()
+    stmt = update(models.Restaurant).where(models.Restaurant.id == restaurant_id).ordered_values(*add_rating(models.Restaurant, rating))
+    await db.execute(stmt.execution_options(synchronize_session=False))
+    await db.commit()
+    db_food = await db.get(models.Food, food_id, populate_existing=True)
+    food_changed(db_food)
+    if db_food.restaurant_id is not None:
+        db_restaurant = await db.get(models.Restaurant, db_food.restaurant_id, populate_existing=True)
+        restaurant_changed(db_restaurant)
+    return db_food
+
+async def rate_restaurant(db: AsyncSession, restaurant_id: int, rating: float):
+    stmt = update(models.Restaurant).where(models.Restaurant.id == restaurant_id).ordered_values(*add_rating(models.Restaurant, rating))
+    result = await db.execute(stmt.execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        return None
+    await db.commit()
+    db_restaurant = await db.get(models.Restaurant, restaurant_id, populate_existing=True)
+    restaurant_changed(db_restaurant)
+    return db_restaurant
+
+
+def to_naive_utc(value: datetime):
+    # the orders columns carry no time zone, everything is stored as UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def get_order_by_idempotency_key(db: AsyncSession, customer_id: int, idempotency_key: str):
+    stmt = select(models.Order).filter(models.Order.customer_id == customer_id, models.Order.idempotency_key == idempotency_key)
+    return await db.scalar(stmt)
+
+async def create_order(db: AsyncSession, order: schemas.OrderCreate, idempotency_key: str | None = None):
+    await kitchen.ensure_loaded(db)
+    await dispatcher.ensure_loaded(db)
+    await stock_levels.ensure_loaded()
+    if idempotency_key:
+        db_order = await get_order_by_idempotency_key(db, order.customer_id, idempotency_key)
+        if db_order is not None:
+            return db_order
+    db_food = await db.get(models.Food, order.food_id)
+    db_customer = await db.get(models.Customer, order.customer_id)
+    if db_food is None or db_customer is None:
+        return None
+    if not stock_levels.reserve(order.food_id, order.quantity):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Food is sold out")
+    city = db_customer.city
+    salesman_id = dispatcher.claim(order.salesman_id) if order.salesman_id is not None else dispatcher.assign(city)
+    now = to_naive_utc(datetime.now(timezone.utc))
+    db_order = models.Order(
+        quantity = order.quantity,
+        ord_date = now.date(),
+        customer_id = order.customer_id,
+        salesman_id = salesman_id,
+        food_id = db_food.id,
+        restaurant_id = db_food.restaurant_id,
+        amount = db_food.price * order.quantity,
+        promised_at = to_naive_utc(order.promised_at) if order.promised_at else now + timedelta(minutes=ORDER_PROMISE_MINUTES),
+        idempotency_key = idempotency_key,
+    )
+    try:
+        db.add(db_order)
+        await record_order(db, db_order, db_customer)
+        await db.commit()
+    except IntegrityError:
+        # a concurrent retry with the same key won the insert
+        stock_levels.release(order.food_id, order.quantity)
+        dispatcher.release(salesman_id)
+        await db.rollback()
+        return await get_order_by_idempotency_key(db, order.customer_id, idempotency_key) if idempotency_key else None
+    except BaseException:
+        stock_levels.release(order.food_id, order.quantity)
+        dispatcher.release(salesman_id)
+        raise
+    kitchen.submit(db_order)
+    if salesman_id is not None:
+        dispatcher.confirm(db_order.id, salesman_id)
+    else:
+        dispatcher.wait(db_order.id, city)
+    return db_order
+
+async def deliver_order(db: AsyncSession, order_id: int):
+    await dispatcher.ensure_loaded(db)
+    db_order = await db.get(models.Order, order_id)
+    if db_order is None:
+        return None
+    if db_order.status != "preparing":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Only orders being prepared can be delivered")
+    db_order.status = "delivered"
+    await db.commit()
+    # the rider's freed slot goes to the oldest order still waiting in that city
+    city = dispatcher.complete(order_id)
+    if city is not None:
+        await dispatcher.rebalance(db, city)
+    await db.refresh(db_order)
+    return db_order
+
+async def set_rider_online(db: AsyncSession, salesman_id: int, online: bool):
+    await dispatcher.ensure_loaded(db)
+    if salesman_id not in dispatcher.riders:
+        db_salesman = await db.get(models.Salesman, salesman_id)
+        if db_salesman is None:
+            return None
+        dispatcher.add_rider(db_salesman)
+    city = dispatcher.set_online(salesman_id, online)
+    moved = await dispatcher.rebalance(db, city)
+    return schemas.RebalanceReport(city=city, moved=len(moved), status=dispatcher.status(city))
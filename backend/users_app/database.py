@@ -1,11 +1,124 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from decouple import config
+from decouple import config, Csv
 
 SQLALCHEMY_DATABASE_URL=config('SQLALCHEMY_DB_URI')
+DB_POOL_SIZE=config('DB_POOL_SIZE', default=5, cast=int)
+DB_MAX_OVERFLOW=config('DB_MAX_OVERFLOW', default=10, cast=int)
+DB_POOL_TIMEOUT=config('DB_POOL_TIMEOUT', default=30, cast=int)
+DB_WARMUP_CONNECTIONS=config('DB_WARMUP_CONNECTIONS', default=0, cast=int)
+SQLALCHEMY_REPLICA_URIS=config('SQLALCHEMY_REPLICA_URIS', default='', cast=Csv())
+REPLICA_RETRY_SECONDS=config('REPLICA_RETRY_SECONDS', default=30, cast=int)
+# catalogue reads stay on the primary this long after a write that adds listings, and for other catalogue
+# writes replica reads aren't cached this long, so replica lag can't refill caches with stale rows
+REPLICA_PIN_SECONDS=config('REPLICA_PIN_SECONDS', default=5, cast=float)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def get_pool_options(url: str):
+    # sqlite picks its own pool class and rejects the queue pool sizing arguments
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=True)
 
-engine=create_engine(SQLALCHEMY_DATABASE_URL)
+
+ASYNC_SQLALCHEMY_DATABASE_URL=config('ASYNC_SQLALCHEMY_DB_URI', default=None) or get_async_url(SQLALCHEMY_DATABASE_URL)
+
+# sync engine for schema creation and offline scripts, the API itself runs on the async engine
+engine=create_engine(SQLALCHEMY_DATABASE_URL, **get_pool_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal=sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Base=declarative_base()
\ No newline at end of file
+async_engine=create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **get_pool_options(SQLALCHEMY_DATABASE_URL))
+AsyncSessionLocal=async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def warm_up(connections: int = DB_WARMUP_CONNECTIONS):
+    # open the connections together so they all stay checked in to the pool for the first requests
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list[str], retry_seconds: int = REPLICA_RETRY_SECONDS, pin_seconds: float = REPLICA_PIN_SECONDS):
+        self.engines = [create_async_engine(get_async_url(url), **get_pool_options(url)) for url in urls]
+        self.sessions = [async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False) for engine in self.engines]
+        self.down_until = [0.0] * len(urls)
+        self.retry_seconds = retry_seconds
+        self.pin_seconds = pin_seconds
+        self.pinned_until = 0.0
+        self.written_until = 0.0
+        self._turn = itertools.count()
+
+    def pin(self):
+        self.pinned_until = time.monotonic() + self.pin_seconds
+
+    def written(self):
+        self.written_until = time.monotonic() + self.pin_seconds
+
+    def lagging(self):
+        # a replica read may still miss the last catalogue write
+        now = time.monotonic()
+        return bool(self.sessions) and self.pinned_until <= now < self.written_until
+
+    def candidates(self):
+        # round robin over the replicas that haven't failed within retry_seconds
+        now = time.monotonic()
+        if not self.sessions or now < self.pinned_until:
+            return []
+        start = next(self._turn)
+        order = [(start + offset) % len(self.sessions) for offset in range(len(self.sessions))]
+        return [index for index in order if self.down_until[index] <= now]
+
+    def healthy(self):
+        now = time.monotonic()
+        return sum(1 for until in self.down_until if until <= now)
+
+    @asynccontextmanager
+    async def session(self):
+        for index in self.candidates():
+            db = self.sessions[index]()
+            try:
+                await db.connection()
+            except (DBAPIError, OSError):
+                await db.close()
+                self.down_until[index] = time.monotonic() + self.retry_seconds
+                logger.warning("replica %d unreachable, skipping it for %ds", index, self.retry_seconds, exc_info=True)
+                continue
+            try:
+                yield db
+            finally:
+                await db.close()
+            return
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    async def dispose(self):
+        await asyncio.gather(*(engine.dispose() for engine in self.engines))
+
+
+replicas = ReplicaRouter(SQLALCHEMY_REPLICA_URIS)
+
+# Base=declarative_base()
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+
+from . import models
+from .analytics import reassign_orders
+from .metrics import dispatch_assignments, dispatch_duration
+
+DISPATCH_STRATEGY = config('DISPATCH_STRATEGY', default='load')
+DISPATCH_MAX_LOAD = config('DISPATCH_MAX_LOAD', default=5, cast=int)
+DISPATCH_REBALANCE_BATCH = config('DISPATCH_REBALANCE_BATCH', default=200, cast=int)
+ACTIVE_STATUSES = ("queued", "preparing")
+
+
+class Rider:
+    __slots__ = ("salesman_id", "city", "commission", "load", "online", "stamp", "orders")
+
+    def __init__(self, salesman_id: int, city: str, commission: float):
+        self.salesman_id = salesman_id
+        self.city = city
+        self.commission = commission
+        self.load = 0
+        self.online = True
+        self.stamp = 0
+        self.orders: set[int] = set()
+
+
+class CityIndex:
+    # two lazily invalidated heaps over the same riders: an entry is live while its stamp matches
+    # the rider's, every change pushes fresh entries and stale ones are dropped when they surface.
+    # Riders that are offline or at capacity have no live entry at all.
+    def __init__(self):
+        self.riders: dict[int, Rider] = {}
+        self.by_load: list[tuple] = []
+        self.by_cost: list[tuple] = []
+        # order id -> salesman_id currently stored on the order, for orders waiting for a rider
+        self.pending: dict[int, int | None] = {}
+
+    def push(self, rider: Rider, stamp: int, max_load: int):
+        rider.stamp = stamp
+        if rider.online and rider.load < max_load:
+            heapq.heappush(self.by_load, (rider.load, rider.commission, stamp, rider.salesman_id))
+            # the commission is a fraction of the order amount, so the cheapest rider is the same for every order
+            heapq.heappush(self.by_cost, (rider.commission, rider.load, stamp, rider.salesman_id))
+        if len(self.by_load) > 2 * len(self.riders) + 64:
+            self.compact(max_load)
+
+    def compact(self, max_load: int):
+        live = [rider for rider in self.riders.values() if rider.online and rider.load < max_load]
+        self.by_load = [(rider.load, rider.commission, rider.stamp, rider.salesman_id) for rider in live]
+        self.by_cost = [(rider.commission, rider.load, rider.stamp, rider.salesman_id) for rider in live]
+        heapq.heapify(self.by_load)
+        heapq.heapify(self.by_cost)
+
+    def best(self, strategy: str):
+        heap = self.by_cost if strategy == "cost" else self.by_load
+        while heap:
+            *_, stamp, salesman_id = heap[0]
+            if self.riders[salesman_id].stamp == stamp:
+                return self.riders[salesman_id]
+            heapq.heappop(heap)
+        return None
+
+
+class DispatchEngine:
+    def __init__(self, strategy: str = DISPATCH_STRATEGY, max_load: int = DISPATCH_MAX_LOAD):
+        self.strategy = strategy
+        self.max_load = max_load
+        self.cities: dict[str, CityIndex] = {}
+        self.riders: dict[int, Rider] = {}
+        self.assigned: dict[int, int] = {}
+        self.stamps = itertools.count(1)
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self, db: AsyncSession):
+        # loads come back from the active orders, every rider starts a restart online
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            for salesman in await db.scalars(select(models.Salesman)):
+                self.add_rider(salesman)
+            stmt = (
+                select(models.Order.id, models.Order.salesman_id, models.Customer.city)
+                .join(models.Customer, models.Customer.customer_id == models.Order.customer_id)
+                .filter(models.Order.status.in_(ACTIVE_STATUSES))
+                .order_by(models.Order.id)
+            )
+            for order_id, salesman_id, city in await db.execute(stmt):
+                if salesman_id in self.riders:
+                    self.confirm(order_id, self.claim(salesman_id))
+                else:
+                    self.wait(order_id, city, salesman_id)
+            self.loaded = True
+
+    def city(self, name: str):
+        return self.cities.setdefault(name, CityIndex())
+
+    def add_rider(self, salesman: models.Salesman):
+        rider = self.riders.get(salesman.salesman_id)
+        if rider is None:
+            rider = self.riders[salesman.salesman_id] = Rider(salesman.salesman_id, salesman.city, salesman.commission)
+            self.city(rider.city).riders[rider.salesman_id] = rider
+            self.touch(rider)
+        return rider
+
+    def touch(self, rider: Rider):
+        self.city(rider.city).push(rider, next(self.stamps), self.max_load)
+
+    def take(self, city: str, strategy: str):
+        rider = self.city(city).best(strategy)
+        if rider is None:
+            return None
+        rider.load += 1
+        self.touch(rider)
+        return rider.salesman_id
+
+    # assign, claim and release never await, so a reservation can't race another one
+    def assign(self, city: str, strategy: str | None = None):
+        strategy = strategy or self.strategy
+        started = time.perf_counter()
+        salesman_id = self.take(city, strategy)
+        dispatch_duration.observe(time.perf_counter() - started, strategy)
+        dispatch_assignments.inc(1, city, "assigned" if salesman_id is not None else "pending")
+        return salesman_id
+
+    def claim(self, salesman_id: int):
+        # a salesman picked by the caller takes the order even above capacity
+        rider = self.riders.get(salesman_id)
+        if rider is not None:
+            rider.load += 1
+            self.touch(rider)
+        return salesman_id
+
+    def release(self, salesman_id: int | None):
+        rider = self.riders.get(salesman_id)
+        if rider is not None:
+            # going offline already cleared the load of reservations still in flight
+            rider.load = max(rider.load - 1, 0)
+            self.touch(rider)
+
+    def confirm(self, order_id: int, salesman_id: int):
+        # called once the order is committed, with the reservation from assign or claim
+        rider = self.riders.get(salesman_id)
+        if rider is None:
+            return
+        if not rider.online:
+            self.wait(order_id, rider.city, salesman_id)
+            return
+        rider.orders.add(order_id)
+        self.assigned[order_id] = salesman_id
+
+    def wait(self, order_id: int, city: str, stored: int | None = None):
+        self.city(city).pending[order_id] = stored
+
+    def complete(self, order_id: int):
+        rider = self.riders.get(self.assigned.pop(order_id, None))
+        if rider is None:
+            for index in self.cities.values():
+                index.pending.pop(order_id, None)
+            return None
+        rider.orders.discard(order_id)
+        self.release(rider.salesman_id)
+        return rider.city
+
+    def set_online(self, salesman_id: int, online: bool):
+        rider = self.riders[salesman_id]
+        rider.online = online
+        if not online:
+            # its orders wait for the next rebalance, still stored against this rider
+            pending = self.city(rider.city).pending
+            for order_id in sorted(rider.orders):
+                pending[order_id] = salesman_id
+                del self.assigned[order_id]
+            rider.orders.clear()
+            rider.load = 0
+        self.touch(rider)
+        return rider.city
+
+    def plan_rebalance(self, city: str):
+        # hands pending orders to riders in the order they started waiting, one O(log n) assignment
+        # each, and returns the (order id, salesman_id) pairs whose stored rider has to change.
+        # Orders nobody can take stay pending, unassigned from riders that went offline.
+        index = self.city(city)
+        changes = []
+        for order_id, stored in list(index.pending.items()):
+            salesman_id = self.take(city, self.strategy)
+            if salesman_id is not None:
+                del index.pending[order_id]
+                self.confirm(order_id, salesman_id)
+                if salesman_id != stored:
+                    changes.append((order_id, salesman_id))
+            elif stored is not None and not getattr(self.riders.get(stored), "online", False):
+                index.pending[order_id] = None
+                changes.append((order_id, None))
+        return changes
+
+    def restore(self, city: str, waiting: list[tuple[int, int | None]], taken: dict[int, int]):
+        # undoes a plan whose write failed: orders it handed out go back to waiting, in their old
+        # place and with the rider the database still has. Orders completed since are left alone.
+        index = self.city(city)
+        restored = {}
+        for order_id, stored in waiting:
+            salesman_id = taken.get(order_id)
+            if salesman_id is not None and self.assigned.get(order_id) == salesman_id:
+                del self.assigned[order_id]
+                self.riders[salesman_id].orders.discard(order_id)
+                self.release(salesman_id)
+            elif order_id not in index.pending:
+                continue
+            restored[order_id] = stored
+        index.pending = restored | {order_id: stored for order_id, stored in index.pending.items() if order_id not in restored}
+
+    async def rebalance(self, db: AsyncSession, city: str, batch_size: int = DISPATCH_REBALANCE_BATCH):
+        # the plan is applied in memory right away so requests running meanwhile see the riders
+        # as taken, and rolled back if the orders and rollups can't be written
+        index = self.city(city)
+        waiting = list(index.pending.items())
+        moved = self.plan_rebalance(city)
+        taken = {order_id: self.assigned[order_id] for order_id, _ in waiting if order_id in self.assigned}
+        try:
+            for start in range(0, len(moved), batch_size):
+                # one statement per batch instead of a write per order, all in one transaction
+                batch = moved[start:start + batch_size]
+                await reassign_orders(db, batch)
+                await db.execute(update(models.Order), [{"id": order_id, "salesman_id": salesman_id} for order_id, salesman_id in batch])
+            await db.commit()
+        except BaseException:
+            self.restore(city, waiting, taken)
+            raise
+        dispatch_assignments.inc(len(moved), city, "rebalanced")
+        return moved
+
+    def status(self, city: str):
+        index = self.cities.get(city) or CityIndex()
+        online = [rider for rider in index.riders.values() if rider.online]
+        return {
+            "city": city,
+            "riders_online": len(online),
+            "riders_at_capacity": sum(1 for rider in online if rider.load >= self.max_load),
+            "active_orders": sum(len(rider.orders) for rider in index.riders.values()),
+            "pending_orders": len(index.pending),
+        }
+
+    def pending(self):
+        return sum(len(index.pending) for index in self.cities.values())
+
+
+dispatcher = DispatchEngine()
@@ -0,0 +1,41 @@
+from sqlalchemy import select
+from decouple import config
+
+from . import models, schemas
+from .database import replicas
+
+EXPORT_BATCH_SIZE = config('EXPORT_BATCH_SIZE', default=1000, cast=int)
+
+EXPORTS = {
+    "food": (models.Food, schemas.Food),
+    "restaurant": (models.Restaurant, schemas.Restaurant),
+    "district": (models.District, schemas.District),
+}
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+async def export_rows(kind: str, fmt: str = "ndjson", batch_size: int = EXPORT_BATCH_SIZE):
+    # the generator owns its session: request dependencies are torn down before a streamed body finishes
+    model, schema = EXPORTS[kind]
+    separator = b"\n" if fmt == "ndjson" else b","
+    async with replicas.session() as db:
+        # yield_per fetches through a server-side cursor and the identity map only holds weak refs,
+        # so at most one batch of rows is alive at a time
+        stmt = select(model).order_by(model.id).execution_options(yield_per=batch_size)
+        result = await db.stream_scalars(stmt)
+        if fmt == "json":
+            yield b"["
+        first = True
+        async for partition in result.partitions():
+            chunk = separator.join(schema.model_validate(row).model_dump_json().encode() for row in partition)
+            if fmt == "ndjson":
+                chunk += separator
+            elif not first:
+                chunk = separator + chunk
+            first = False
+            yield chunk
+        if fmt == "json":
+            yield b"]"
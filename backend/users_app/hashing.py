@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException, status
+from decouple import config
+
+from .metrics import span
+
+HASH_POOL = config('HASH_POOL', default='thread')
+HASH_WORKERS = config('HASH_WORKERS', default=4, cast=int)
+HASH_MAX_PENDING = config('HASH_MAX_PENDING', default=64, cast=int)
+HASH_ALGORITHM = config('HASH_ALGORITHM')
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # built on first use, and once per process in a process pool
+    from passlib.context import CryptContext
+    return CryptContext(schemes=[HASH_ALGORITHM], deprecated="auto")
+
+
+def _hash(password: str):
+    return get_pwd_context().hash(password)
+
+def _verify(plain_password: str, hashed_password: str):
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def find_hash(plain_password: str, hashed_passwords: list[str]):
+    # the first hash plain_password matches, a whole scan in one worker call
+    for hashed_password in hashed_passwords:
+        if _verify(plain_password, hashed_password):
+            return hashed_password
+    return None
+
+
+class HashingService:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING, pool: str = HASH_POOL):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pool = pool
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.pool == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        # shed load once the queue is full instead of letting every login wait behind it
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_service = HashingService()
+
+
+async def hash_password(password: str):
+    with span("bcrypt_hash"):
+        return await hashing_service.run(_hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str):
+    with span("bcrypt_verify"):
+        return await hashing_service.run(_verify, plain_password, hashed_password)
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from fastapi import HTTPException, status
+from decouple import config, Csv
+
+IMAGE_CACHE_DIR = config('IMAGE_CACHE_DIR', default='.image-cache')
+IMAGE_CACHE_MAX_BYTES = config('IMAGE_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+IMAGE_CACHE_MAX_AGE = config('IMAGE_CACHE_MAX_AGE', default=30 * 24 * 3600, cast=int)
+# remote sources are only fetched from these hosts, an empty list disables remote fetching
+IMAGE_ALLOWED_HOSTS = config('IMAGE_ALLOWED_HOSTS', default='', cast=Csv())
+# non-URL sources are read from here, e.g. a local file store standing in for the image host
+IMAGE_SOURCE_ROOT = config('IMAGE_SOURCE_ROOT', default='')
+IMAGE_MAX_SOURCE_BYTES = config('IMAGE_MAX_SOURCE_BYTES', default=10 * 1024 * 1024, cast=int)
+IMAGE_FETCH_TIMEOUT = config('IMAGE_FETCH_TIMEOUT', default=10, cast=float)
+IMAGE_BASE_URL = config('IMAGE_BASE_URL', default='')
+IMAGE_SIZES = {"sm": 160, "md": 480, "lg": 1024}
+IMAGE_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+
+
+@lru_cache(maxsize=65536)
+def thumbnail_urls(source: str | None, fmt: str = "webp"):
+    if not source:
+        return {}
+    return {size: f"{IMAGE_BASE_URL}/api/v1/images/{size}.{fmt}?src={quote(source, safe='')}" for size in IMAGE_SIZES}
+
+def digest(data: bytes):
+    return blake2b(data, digest_size=16).hexdigest()
+
+def entry(kind: str, key: str, suffix: str = ""):
+    # two character fan-out keeps directories small
+    return f"{kind}/{key[:2]}/{key}{suffix}"
+
+
+class DiskLRU:
+    # files under root, evicted least recently used first once their total size passes max_bytes
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self):
+        files = sorted((path for path in self.root.rglob("*") if path.is_file() and not path.name.endswith(".tmp")), key=lambda path: path.stat().st_atime)
+        for path in files:
+            size = path.stat().st_size
+            self.entries[path.relative_to(self.root).as_posix()] = size
+            self.size += size
+        self._loaded = True
+
+    def get(self, name: str):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        return self.root / name
+
+    def read(self, name: str):
+        path = self.get(name)
+        try:
+            return path.read_bytes() if path is not None else None
+        except FileNotFoundError:
+            self.discard(name)
+            return None
+
+    def put(self, name: str, data: bytes):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self.size += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                evicted, size = self.entries.popitem(last=False)
+                self.size -= size
+                (self.root / evicted).unlink(missing_ok=True)
+        return path
+
+    def discard(self, name: str):
+        with self._lock:
+            self.size -= self.entries.pop(name, 0)
+
+
+def render_thumbnail(source: bytes, width: int, fmt: str):
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width))
+        pil_format, _ = IMAGE_FORMATS[fmt]
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+        out = BytesIO()
+        if pil_format == "JPEG":
+            image.save(out, pil_format, quality=82, optimize=True, progressive=True)
+        else:
+            image.save(out, pil_format, quality=80, method=4)
+        return out.getvalue()
+
+def check_image(data: bytes):
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Source is not a supported image")
+
+
+class ImagePipeline:
+    # sources are stored once under their content digest, thumbnails are derived from the digest,
+    # and url/ entries remember which digest a source URL resolved to
+    def __init__(self, cache: DiskLRU, allowed_hosts: list[str] = IMAGE_ALLOWED_HOSTS, source_root: str = IMAGE_SOURCE_ROOT):
+        self.cache = cache
+        self.allowed_hosts = set(allowed_hosts)
+        self.source_root = Path(source_root).resolve() if source_root else None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._http = None
+
+    async def fetch(self, source: str):
+        url = urlsplit(source)
+        if url.scheme in ("http", "https"):
+            if url.hostname not in self.allowed_hosts:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image host is not allowed")
+            return await self._fetch_remote(source)
+        if self.source_root is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image source must be an http(s) URL")
+        path = (self.source_root / source.lstrip("/")).resolve()
+        if not path.is_relative_to(self.source_root) or not path.is_file():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image source not found")
+        if path.stat().st_size > IMAGE_MAX_SOURCE_BYTES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image source is too large")
+        return await asyncio.to_thread(path.read_bytes)
+
+    async def _fetch_remote(self, source: str):
+        import aiohttp
+
+        if self._http is None:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT))
+        try:
+            # no redirects, they could lead off the allowed hosts
+            async with self._http.get(source, allow_redirects=False) as response:
+                if response.status != 200:
+                    raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Image host answered {response.status}")
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    data += chunk
+                    if len(data) > IMAGE_MAX_SOURCE_BYTES:
+                        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image source is too large")
+                return bytes(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Could not fetch image source")
+
+    async def store(self, data: bytes):
+        if len(data) > IMAGE_MAX_SOURCE_BYTES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image source is too large")
+        await asyncio.to_thread(check_image, data)
+        key = digest(data)
+        if await asyncio.to_thread(self.cache.get, entry("src", key)) is None:
+            await asyncio.to_thread(self.cache.put, entry("src", key), data)
+        return key
+
+    async def resolve(self, source: str):
+        # the source is fetched on first use only, later requests go straight to its digest
+        url_entry = entry("url", digest(source.encode()))
+        key = await asyncio.to_thread(self.cache.read, url_entry)
+        if key is not None and await asyncio.to_thread(self.cache.get, entry("src", key.decode())) is not None:
+            return key.decode()
+        key = await self.store(await self.fetch(source))
+        await asyncio.to_thread(self.cache.put, url_entry, key.encode())
+        return key
+
+    async def thumbnail(self, key: str, size: str, fmt: str):
+        name = entry("thumb", key, f"-{size}.{fmt}")
+        data = await asyncio.to_thread(self.cache.read, name)
+        if data is not None:
+            return data
+        # concurrent requests for the same thumbnail share one render
+        if name not in self._inflight:
+            self._inflight[name] = asyncio.ensure_future(self._render(key, name, size, fmt))
+            self._inflight[name].add_done_callback(lambda _: self._inflight.pop(name, None))
+        return await asyncio.shield(self._inflight[name])
+
+    async def _render(self, key: str, name: str, size: str, fmt: str):
+        source = await asyncio.to_thread(self.cache.read, entry("src", key))
+        if source is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+        data = await asyncio.to_thread(render_thumbnail, source, IMAGE_SIZES[size], fmt)
+        await asyncio.to_thread(self.cache.put, name, data)
+        return data
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+image_pipeline = ImagePipeline(DiskLRU(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES))
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+from pathlib import Path
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+
+from . import models, schemas
+from .cache import catalogue_cache
+from .search import catalogue_search
+from .ranking import rankings
+from .database import AsyncSessionLocal, replicas
+
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+IMPORT_MAX_ERRORS = 1000
+
+MODELS = {
+    "district": models.District,
+    "restaurant": models.Restaurant,
+    "food": models.Food,
+}
+# field names used by the frontend seed files
+DISTRICT_ALIASES = {"district": "name", "district_image": "image_url"}
+
+
+def parse_rows(data: bytes | str, fmt: str):
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    if fmt == "json":
+        yield from json.loads(data)
+    elif fmt == "ndjson":
+        for line in io.StringIO(data):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    # reported against its row by the importer instead of rejecting the whole file
+                    yield e
+    elif fmt == "csv":
+        yield from csv.DictReader(io.StringIO(data))
+    else:
+        raise ValueError(f"Unsupported format {fmt}")
+
+
+class Importer:
+    def __init__(self, db: AsyncSession, kind: str):
+        self.db = db
+        self.kind = kind
+        self.district_ids: dict[str, int] = {}
+        self.known_district_ids: set[int] = set()
+        self.restaurant_ids: set[int] = set()
+        self.taken_ids: set[int] = set()
+        self.keep_ids: bool | None = None
+
+    async def load_references(self):
+        # one query per referenced table instead of one lookup per row
+        self.taken_ids = set(await self.db.scalars(select(MODELS[self.kind].id)))
+        if self.kind in ("district", "restaurant"):
+            self.district_ids = dict((await self.db.execute(select(models.District.name, models.District.id))).all())
+            self.known_district_ids = set(self.district_ids.values())
+        if self.kind == "food":
+            self.restaurant_ids = set(await self.db.scalars(select(models.Restaurant.id)))
+
+    def prepare(self, row: dict):
+        if isinstance(row, Exception):
+            raise row
+        row = dict(row)
+        row_id = row.pop("id", None)
+        values = self.with_id(self.validate(row), None if row_id in (None, "") else row_id)
+        if self.kind == "district":
+            self.district_ids[values["name"]] = values.get("id")
+        return values
+
+    def with_id(self, values: dict, row_id):
+        # ids from the file are kept so later files can reference them. A file either gives
+        # every row an id or none, so database assigned ids can't collide with the file's.
+        if self.keep_ids is None:
+            self.keep_ids = row_id is not None
+        if (row_id is not None) != self.keep_ids:
+            raise ValueError("either every row or no row may have an id")
+        if row_id is None:
+            return values
+        row_id = int(row_id)
+        if row_id in self.taken_ids:
+            raise ValueError(f"id {row_id} already exists")
+        self.taken_ids.add(row_id)
+        return {"id": row_id, **values}
+
+    def validate(self, row: dict):
+        if self.kind == "district":
+            row = {DISTRICT_ALIASES.get(key, key): value for key, value in row.items()}
+            district = schemas.DistrictBase.model_validate(row)
+            if district.name in self.district_ids:
+                raise ValueError(f"district {district.name!r} already exists")
+            return district.model_dump()
+        if self.kind == "restaurant":
+            if "district" in row and not row.get("district_id"):
+                if row["district"] not in self.district_ids:
+                    raise ValueError(f"unknown district {row['district']!r}")
+                row = {**row, "district_id": self.district_ids[row["district"]]}
+            restaurant = schemas.RestaurantCreate.model_validate(row)
+            if restaurant.district_id not in self.known_district_ids:
+                raise ValueError(f"unknown district_id {restaurant.district_id}")
+            return restaurant.model_dump()
+        food = schemas.FoodCreate.model_validate(row)
+        if food.restaurant_id not in self.restaurant_ids:
+            raise ValueError(f"unknown restaurant_id {food.restaurant_id}")
+        return food.model_dump()
+
+    async def run(self, rows, batch_size: int = IMPORT_BATCH_SIZE):
+        await self.load_references()
+        inserted = 0
+        failed = 0
+        errors = []
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            try:
+                batch.append(self.prepare(row))
+            except (ValidationError, ValueError, TypeError, AttributeError) as e:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append(schemas.ImportRowError(row=number, error=str(e)))
+                continue
+            if len(batch) >= batch_size:
+                await self.db.execute(insert(MODELS[self.kind]), batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            await self.db.execute(insert(MODELS[self.kind]), batch)
+            inserted += len(batch)
+        # every batch lands in the same transaction, a failed insert leaves nothing behind
+        await self.db.commit()
+        replicas.pin()
+        catalogue_cache.invalidate(self.kind)
+        if self.kind != "district":
+            catalogue_search.reset()
+            rankings.reset()
+        return schemas.ImportReport(kind=self.kind, inserted=inserted, failed=failed, errors=errors)
+
+
+async def import_catalogue(db: AsyncSession, kind: str, rows, batch_size: int = IMPORT_BATCH_SIZE):
+    return await Importer(db, kind).run(rows, batch_size)
+
+
+async def main(kind: str, path: Path, fmt: str, batch_size: int):
+    async with AsyncSessionLocal() as db:
+        report = await import_catalogue(db, kind, parse_rows(path.read_bytes(), fmt), batch_size)
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load districts, restaurants or foods")
+    parser.add_argument("kind", choices=list(MODELS))
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=["json", "ndjson", "csv"])
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.kind, args.path, args.format or args.path.suffix.lstrip(".") or "json", args.batch_size))
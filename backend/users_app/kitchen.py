@@ -0,0 +1,100 @@
+import asyncio
+import heapq
+import itertools
+import math
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+
+from . import models
+
+KITCHEN_STATIONS = config('KITCHEN_STATIONS', default=4, cast=int)
+KITCHEN_BATCH_SIZE = config('KITCHEN_BATCH_SIZE', default=8, cast=int)
+KITCHEN_BATCH_PREP_SECONDS = config('KITCHEN_BATCH_PREP_SECONDS', default=600, cast=int)
+
+
+class KitchenQueue:
+    def __init__(self):
+        # (promised_at, arrival, order_id, quantity): earliest promise first, ties in arrival order
+        self.heap: list[tuple[datetime, int, int, int]] = []
+        self.items = 0
+
+    def push(self, promised_at: datetime, arrival: int, order_id: int, quantity: int):
+        heapq.heappush(self.heap, (promised_at, arrival, order_id, quantity))
+        self.items += quantity
+
+    def pop_batch(self, size: int):
+        batch = []
+        while self.heap and len(batch) < size:
+            entry = heapq.heappop(self.heap)
+            self.items -= entry[3]
+            batch.append(entry)
+        return batch
+
+    def estimated_prep_seconds(self):
+        batches = math.ceil(len(self.heap) / KITCHEN_BATCH_SIZE)
+        return math.ceil(batches / KITCHEN_STATIONS) * KITCHEN_BATCH_PREP_SECONDS
+
+
+class KitchenScheduler:
+    def __init__(self):
+        self.queues: dict[int, KitchenQueue] = {}
+        self.queued: set[int] = set()
+        self.arrivals = itertools.count()
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self, db: AsyncSession):
+        # queued orders survive a restart in the database, the heaps are rebuilt from them once
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            stmt = select(models.Order).filter(models.Order.status == "queued").order_by(models.Order.id)
+            for order in await db.scalars(stmt):
+                self.submit(order)
+            self.loaded = True
+
+    def submit(self, order: models.Order):
+        if order.id in self.queued:
+            return
+        self.queued.add(order.id)
+        queue = self.queues.setdefault(order.restaurant_id, KitchenQueue())
+        queue.push(order.promised_at, next(self.arrivals), order.id, order.quantity)
+
+    async def next_batch(self, db: AsyncSession, restaurant_id: int, size: int = KITCHEN_BATCH_SIZE):
+        queue = self.queues.get(restaurant_id)
+        batch = queue.pop_batch(size) if queue is not None else []
+        if not batch:
+            return []
+        order_ids = [order_id for _, _, order_id, _ in batch]
+        self.queued.difference_update(order_ids)
+        try:
+            stmt = update(models.Order).where(models.Order.id.in_(order_ids)).values(status="preparing")
+            await db.execute(stmt.execution_options(synchronize_session=False))
+            await db.commit()
+        except BaseException:
+            # the orders are still queued in the database, so they go back in their old place
+            for entry in batch:
+                queue.push(*entry)
+            self.queued.update(order_ids)
+            raise
+        stmt = select(models.Order).filter(models.Order.id.in_(order_ids)).execution_options(populate_existing=True)
+        orders = {order.id: order for order in await db.scalars(stmt)}
+        return [orders[order_id] for order_id in order_ids if order_id in orders]
+
+    def status(self, restaurant_id: int):
+        queue = self.queues.get(restaurant_id) or KitchenQueue()
+        return {
+            "restaurant_id": restaurant_id,
+            "queue_depth": len(queue.heap),
+            "queued_items": queue.items,
+            "estimated_prep_seconds": queue.estimated_prep_seconds(),
+            "next_promised_at": queue.heap[0][0] if queue.heap else None,
+        }
+
+
+kitchen = KitchenScheduler()
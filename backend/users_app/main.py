@@ -1,60 +1,103 @@
-from typing import Annotated
+import logging
+from contextlib import asynccontextmanager
+from typing import Annotated, Literal
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import APIRouter, Body, FastAPI, Depends, Header, HTTPException, Path, Query, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import timedelta
-
-from .database import SessionLocal, engine
-from .crud import authenticate_user, ACCESS_TOKEN_EXPIRES_MINUTES, create_access_token, oauth2_scheme, get_current_user, set_active, get_all_district, get_all_food, get_all_restaurant, get_restaurant_by_district, get_user_by_email, create_user, get_food_by_restaurant, get_restaurant_by_id
-from .schemas import Token, OTP, User, UserCreate, District, Food, Restaurant
-from .otp import send_otp, verify_otp
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
+from datetime import date, timedelta
+from decouple import config
+
+from .database import AsyncSessionLocal, async_engine, replicas, warm_up, DB_WARMUP_CONNECTIONS
+from .crud import authenticate_user, ACCESS_TOKEN_EXPIRES_MINUTES, create_access_token, get_token_claims, decode_token, oauth2_scheme, get_current_user, set_active, get_all_district, get_all_food, get_all_restaurant, get_restaurant_by_district, create_user, create_users, PROVISION_MAX_BATCH, get_food_by_restaurant, get_restaurant_by_id, get_food_page, get_restaurant_page, get_restaurant_with_menu, get_district_with_restaurants, rate_food, rate_restaurant, create_order, deliver_order, set_rider_online
+from .schemas import Token, OTP, User, UserCreate, District, Food, Restaurant, FoodPage, RestaurantPage, RestaurantWithMenu, DistrictWithRestaurants, SearchResults, ImportReport, Rating, Order, OrderCreate, KitchenStatus, RevenueDay, SalesmanReport, ProvisionReport, ImageUpload, StockUpdate, DispatchStatus, RebalanceReport
+from .otp import send_otp, verify_otp, otp_dispatcher
+from .hashing import hashing_service
+from .metrics import InstrumentationMiddleware, render_metrics
+from .cache import cached_response
+from .serialization import Layout, district_rows, food_rows, restaurant_rows
+from .pagination import decode_cursor
+from .export import export_rows, MEDIA_TYPES
+from .search import catalogue_search
+from .ranking import rankings, RANKING_SIZE
+from .kitchen import kitchen, KITCHEN_BATCH_SIZE
+from .dispatch import dispatcher
+from .analytics import revenue_by_day, top_salesmen, commission_payable, date_range
+from .ingest import import_catalogue, parse_rows
 from .models import Base
+from .stock import stock_levels
+from .images import image_pipeline, IMAGE_BASE_URL, IMAGE_CACHE_MAX_AGE, IMAGE_FORMATS, IMAGE_SIZES
+
+# schema changes go through alembic, create_all is only a convenience for throwaway databases
+AUTO_CREATE_SCHEMA = config('AUTO_CREATE_SCHEMA', default=False, cast=bool)
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+router = APIRouter()
 
 origins = [
     "http://localhost:3001",
     "http://localhost:3000"
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_read_db():
+    # anonymous catalogue reads only, anything that writes or reads its own writes uses get_db
+    async with replicas.session() as db:
         yield db
-    finally:
-        db.close()
 
-@app.get("/")
+food_page = TypeAdapter(FoodPage)
+restaurant_page = TypeAdapter(RestaurantPage)
+
+
+def serialize(adapter: TypeAdapter, data):
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+@router.get("/")
 async def root():
     return {"message": "Hi there"}
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    gauges = {
+        "hash_pending": hashing_service.pending,
+        "otp_queue_depth": otp_dispatcher.stats()["queue_depth"],
+        "db_replicas_healthy": replicas.healthy(),
+        "stock_pending_writes": len(stock_levels.dirty),
+        "dispatch_pending_orders": dispatcher.pending(),
+    }
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
 
 ###########################################################################################################
 ########################################## USERS API ENDPOINTS ############################################
 ###########################################################################################################
 
-@app.post("/api/v1/users/", response_model=User)
-def post_user(user: UserCreate, db: Annotated[Session, Depends(get_db)]):
-    db_user = get_user_by_email(db, email=user.email)
-    if db_user:
+@router.post("/api/v1/users/", response_model=User)
+async def post_user(user: UserCreate, db: Annotated[AsyncSession, Depends(get_db)]):
+    db_user = await create_user(db=db, user=user)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return create_user(db=db, user=user)
+    return db_user
 
-
-@app.get("/api/v1/users/me/", response_model=User)
-async def read_users_me(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)]):
+@router.post("/api/v1/users/batch/", response_model=ProvisionReport)
+async def post_users(users: Annotated[list[UserCreate], Body(max_length=PROVISION_MAX_BATCH)], token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    user = await get_current_user(token, db)
+    # a batch costs two bcrypt hashes per account, only verified users may send one
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Verify your account before provisioning users")
+    created, errors = await create_users(db, users)
+    return ProvisionReport(created=created, failed=len(errors), errors=errors)
+
+@router.get("/api/v1/users/me/", response_model=User)
+async def read_users_me(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
     user = await get_current_user(token = token, db = db)
     return user
 
@@ -68,10 +111,9 @@ async def read_users_me(token: Annotated[str, Depends(oauth2_scheme)], db: Annot
 ###########################################################################################################
 ####################################### LOGIN/TOKEN API ENDPOINTS #########################################
 ###########################################################################################################
-@app.post("/api/v1/token/")
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Annotated[Session, Depends(get_db)]):
-    user = authenticate_user(form_data.username, form_data.password, db)
-    print(user)
+@router.post("/api/v1/token/")
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Annotated[AsyncSession, Depends(get_db)]):
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -80,12 +122,15 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
             )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRES_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=get_token_claims(user), expires_delta=access_token_expires
     )
     return Token(access_token = access_token, token_type = "bearer")
 
-@app.get("/api/v1/token/verify/")
-async def verify_token(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)]):
+@router.get("/api/v1/token/verify/")
+async def verify_token(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    # tokens carrying their own claims are verified by signature alone
+    if decode_token(token).user_id is not None:
+        return True
     user = await get_current_user(token, db)
     if user.email is None:
         return False
@@ -99,15 +144,19 @@ async def verify_token(token: Annotated[str, Depends(oauth2_scheme)], db: Annota
 ###########################################################################################################
 
 
-@app.get("/api/v1/otp/")
-async def getotp(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)]):
+@router.get("/api/v1/otp/")
+async def getotp(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
     await send_otp(token, db)
     return {"message": "OTP send successfully"}
 
-@app.post("/api/v1/otp/verify/", response_model=None)
-async def postotp(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)], otp: OTP):
+@router.get("/api/v1/otp/stats/")
+async def otp_stats():
+    return otp_dispatcher.stats()
+
+@router.post("/api/v1/otp/verify/", response_model=None)
+async def postotp(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], otp: OTP):
     is_valid = verify_otp(otp_str=otp.otp)
-    print(is_valid)
+    logger.debug("otp valid: %s", is_valid)
     if is_valid:
        return await set_active(token=token, db=db)
     return False
@@ -125,9 +174,18 @@ async def postotp(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[S
 ######################################## DISTRICT API ENDPOINTS ###########################################
 ###########################################################################################################
 
-@app.get("/api/v1/district/", response_model=list[District])
-async def get_district(db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: int = 64):
-    return await get_all_district(db, skip, limit)
+@router.get("/api/v1/district/", response_model=list[District])
+async def get_district(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], skip: int = 0, limit: int = 64, layout: Layout = "rows"):
+    async def load():
+        return district_rows.encode(await get_all_district(db, skip, limit), layout)
+    return await cached_response(request, f"district:{layout}:{skip}:{limit}", load)
+
+@router.get("/api/v1/district/{district_id}/restaurants/", response_model=DistrictWithRestaurants)
+async def district_with_restaurants(district_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
+    district = await get_district_with_restaurants(db, district_id)
+    if district is None:
+        raise HTTPException(status_code=404, detail="District not found")
+    return district
 
 ###########################################################################################################
 ######################################## DISTRICT API ENDPOINTS ###########################################
@@ -137,16 +195,41 @@ async def get_district(db: Annotated[Session, Depends(get_db)], skip: int = 0, l
 ########################################### FOOD API ENDPOINTS ############################################
 ###########################################################################################################
 
-@app.get("/api/v1/food/", response_model=list[Food])
-async def get_district(db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: int = 1000):
-    return await get_all_food(db, skip, limit)
-
-@app.get("/api/v1/food/{restaurant_id}/", response_model=list[Food])
-async def restaurant_food(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)]):
+@router.get("/api/v1/food/", response_model=list[Food])
+async def get_district(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], skip: int = 0, limit: int = 1000, layout: Layout = "rows"):
+    async def load():
+        return food_rows.encode(await get_all_food(db, skip, limit), layout)
+    return await cached_response(request, f"food:{layout}:{skip}:{limit}", load)
+
+@router.get("/api/v1/food/page/", response_model=FoodPage)
+async def food_page_view(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], cursor: str | None = None, sort: Literal["id", "ratings"] = "id", limit: Annotated[int, Query(ge=1, le=500)] = 50):
+    async def load():
+        return serialize(food_page, await get_food_page(db, decode_cursor(cursor, sort), sort, limit))
+    return await cached_response(request, f"food:page:{sort}:{limit}:{cursor}", load)
+
+@router.post("/api/v1/food/{food_id}/rating/", response_model=Food)
+async def post_food_rating(food_id: int, rating: Rating, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    food = await rate_food(db, food_id, rating.rating)
+    if food is None:
+        raise HTTPException(status_code=404, detail="Food not found")
+    return food
+
+@router.put("/api/v1/food/{food_id}/stock/", response_model=Food)
+async def put_food_stock(food_id: int, stock: StockUpdate, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    await stock_levels.ensure_loaded()
+    food = await stock_levels.set_stock(db, food_id, stock.stock)
+    if food is None:
+        raise HTTPException(status_code=404, detail="Food not found")
+    return food
+
+@router.get("/api/v1/food/{restaurant_id}/", response_model=list[Food])
+async def restaurant_food(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], layout: Layout = "rows"):
     user = await get_current_user(token, db)
     if user.email is None:
         return False
-    return await get_food_by_restaurant(db, restaurant_id)
+    return Response(content=food_rows.encode(await get_food_by_restaurant(db, restaurant_id), layout), media_type="application/json")
 
 ###########################################################################################################
 ########################################### FOOD API ENDPOINTS ############################################
@@ -156,21 +239,269 @@ async def restaurant_food(restaurant_id: int, token: Annotated[str, Depends(oaut
 ######################################## RESTAURANT API ENDPOINTS #########################################
 ###########################################################################################################
 
-@app.get("/api/v1/restaurant/", response_model=list[Restaurant])
-async def get_district(db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: int = 1000):
-    return await get_all_restaurant(db, skip, limit)
-
-@app.get("/api/v1/restaurant/{district_id}", response_model=list[Restaurant])
-async def district_restaurant(db: Annotated[Session, Depends(get_db)], district_id: int):
-    return await get_restaurant_by_district(db, district_id)
-
-@app.get("/api/v1/restaurant/profile/{restaurant_id}/", response_model=Restaurant)
-async def get_restaurant_profile(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db)]):
-    user = get_current_user(token, db)
+@router.get("/api/v1/restaurant/", response_model=list[Restaurant])
+async def get_district(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], skip: int = 0, limit: int = 1000, layout: Layout = "rows"):
+    async def load():
+        return restaurant_rows.encode(await get_all_restaurant(db, skip, limit), layout)
+    return await cached_response(request, f"restaurant:{layout}:{skip}:{limit}", load)
+
+@router.get("/api/v1/restaurant/page/", response_model=RestaurantPage)
+async def restaurant_page_view(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], cursor: str | None = None, sort: Literal["id", "ratings"] = "id", limit: Annotated[int, Query(ge=1, le=500)] = 50):
+    async def load():
+        return serialize(restaurant_page, await get_restaurant_page(db, decode_cursor(cursor, sort), sort, limit))
+    return await cached_response(request, f"restaurant:page:{sort}:{limit}:{cursor}", load)
+
+@router.get("/api/v1/restaurant/{district_id}", response_model=list[Restaurant])
+async def district_restaurant(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)], district_id: int, layout: Layout = "rows"):
+    async def load():
+        return restaurant_rows.encode(await get_restaurant_by_district(db, district_id), layout)
+    return await cached_response(request, f"restaurant:district:{district_id}:{layout}", load)
+
+@router.get("/api/v1/restaurant/profile/{restaurant_id}/", response_model=Restaurant)
+async def get_restaurant_profile(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    user = await get_current_user(token, db)
     if user.email is None:
         return False
     return await get_restaurant_by_id(db, restaurant_id)
 
+@router.post("/api/v1/restaurant/{restaurant_id}/rating/", response_model=Restaurant)
+async def post_restaurant_rating(restaurant_id: int, rating: Rating, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    restaurant = await rate_restaurant(db, restaurant_id, rating.rating)
+    if restaurant is None:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    return restaurant
+
+@router.get("/api/v1/restaurant/menu/{restaurant_id}/", response_model=RestaurantWithMenu)
+async def restaurant_with_menu(restaurant_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
+    restaurant = await get_restaurant_with_menu(db, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    return restaurant
+
 ###########################################################################################################
 ######################################## RESTAURANT API ENDPOINTS #########################################
-###########################################################################################################
\ No newline at end of file
+###########################################################################################################
+
+###########################################################################################################
+########################################## EXPORT API ENDPOINTS ###########################################
+###########################################################################################################
+
+@router.get("/api/v1/export/{kind}/")
+async def export_catalogue(kind: Literal["food", "restaurant", "district"], format: Literal["ndjson", "json"] = "ndjson"):
+    return StreamingResponse(export_rows(kind, format), media_type=MEDIA_TYPES[format])
+
+###########################################################################################################
+########################################## EXPORT API ENDPOINTS ###########################################
+###########################################################################################################
+
+###########################################################################################################
+########################################## SEARCH API ENDPOINTS ###########################################
+###########################################################################################################
+
+@router.get("/api/v1/search/", response_model=SearchResults)
+async def search_catalogue(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    kind: Literal["all", "food", "restaurant"] = "all",
+    district_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+):
+    await catalogue_search.ensure_loaded(db)
+    results = SearchResults()
+    if kind in ("all", "food"):
+        results.foods = catalogue_search.search_foods(q, district_id, min_price, max_price, limit)
+    if kind in ("all", "restaurant"):
+        results.restaurants = catalogue_search.search_restaurants(q, district_id, limit)
+    return results
+
+###########################################################################################################
+########################################## SEARCH API ENDPOINTS ###########################################
+###########################################################################################################
+
+###########################################################################################################
+########################################## IMPORT API ENDPOINTS ###########################################
+###########################################################################################################
+
+@router.post("/api/v1/import/{kind}/", response_model=ImportReport)
+async def import_catalogue_file(kind: Literal["district", "restaurant", "food"], file: UploadFile, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], format: Literal["json", "ndjson", "csv"] = "json"):
+    await get_current_user(token, db)
+    try:
+        return await import_catalogue(db, kind, parse_rows(await file.read(), format))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse file: {e}")
+
+###########################################################################################################
+########################################## IMPORT API ENDPOINTS ###########################################
+###########################################################################################################
+
+###########################################################################################################
+######################################### RANKING API ENDPOINTS ###########################################
+###########################################################################################################
+
+@router.get("/api/v1/ranking/restaurant/{district_id}/", response_model=list[Restaurant])
+async def top_restaurants(district_id: int, limit: Annotated[int, Query(ge=1, le=RANKING_SIZE)] = 10):
+    await rankings.ensure_loaded()
+    return rankings.top_restaurants(district_id, limit)
+
+@router.get("/api/v1/ranking/food/", response_model=list[Food])
+async def top_foods(district_id: int | None = None, limit: Annotated[int, Query(ge=1, le=RANKING_SIZE)] = 10):
+    await rankings.ensure_loaded()
+    return rankings.top_foods(district_id, limit)
+
+###########################################################################################################
+######################################### RANKING API ENDPOINTS ###########################################
+###########################################################################################################
+
+###########################################################################################################
+########################################## ORDER API ENDPOINTS ############################################
+###########################################################################################################
+
+@router.post("/api/v1/orders/", response_model=Order)
+async def place_order(order: OrderCreate, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], idempotency_key: Annotated[str | None, Header(max_length=64)] = None):
+    await get_current_user(token, db)
+    db_order = await create_order(db, order, idempotency_key)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Customer or food not found")
+    return db_order
+
+@router.get("/api/v1/kitchen/{restaurant_id}/queue/", response_model=KitchenStatus)
+async def kitchen_queue(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    await kitchen.ensure_loaded(db)
+    return kitchen.status(restaurant_id)
+
+@router.post("/api/v1/kitchen/{restaurant_id}/batch/", response_model=list[Order])
+async def kitchen_batch(restaurant_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], size: Annotated[int, Query(ge=1, le=50)] = KITCHEN_BATCH_SIZE):
+    await get_current_user(token, db)
+    await kitchen.ensure_loaded(db)
+    return await kitchen.next_batch(db, restaurant_id, size)
+
+@router.post("/api/v1/orders/{order_id}/delivered/", response_model=Order)
+async def order_delivered(order_id: int, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    db_order = await deliver_order(db, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return db_order
+
+###########################################################################################################
+########################################## ORDER API ENDPOINTS ############################################
+###########################################################################################################
+
+###########################################################################################################
+######################################### DISPATCH API ENDPOINTS ##########################################
+###########################################################################################################
+
+@router.get("/api/v1/dispatch/{city}/", response_model=DispatchStatus)
+async def dispatch_status(city: str, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    await dispatcher.ensure_loaded(db)
+    return dispatcher.status(city)
+
+@router.post("/api/v1/dispatch/riders/{salesman_id}/{state}/", response_model=RebalanceReport)
+async def rider_availability(salesman_id: int, state: Literal["online", "offline"], token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    report = await set_rider_online(db, salesman_id, state == "online")
+    if report is None:
+        raise HTTPException(status_code=404, detail="Salesman not found")
+    return report
+
+###########################################################################################################
+######################################### DISPATCH API ENDPOINTS ##########################################
+###########################################################################################################
+
+###########################################################################################################
+######################################## ANALYTICS API ENDPOINTS ##########################################
+###########################################################################################################
+
+@router.get("/api/v1/analytics/revenue/", response_model=list[RevenueDay])
+async def revenue_report(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], start: date | None = None, end: date | None = None, city: str | None = None, grade: int | None = None):
+    await get_current_user(token, db)
+    return await revenue_by_day(db, *date_range(start, end), city, grade)
+
+@router.get("/api/v1/analytics/salesmen/top/", response_model=list[SalesmanReport])
+async def top_salesmen_report(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], start: date | None = None, end: date | None = None, limit: Annotated[int, Query(ge=1, le=100)] = 10):
+    await get_current_user(token, db)
+    return await top_salesmen(db, *date_range(start, end), limit)
+
+@router.get("/api/v1/analytics/commission/", response_model=list[SalesmanReport])
+async def commission_report(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)], start: date | None = None, end: date | None = None):
+    await get_current_user(token, db)
+    return await commission_payable(db, *date_range(start, end))
+
+###########################################################################################################
+######################################## ANALYTICS API ENDPOINTS ##########################################
+###########################################################################################################
+
+###########################################################################################################
+########################################## IMAGE API ENDPOINTS ############################################
+###########################################################################################################
+
+ImageSize = Literal[tuple(IMAGE_SIZES)]
+ImageFormat = Literal[tuple(IMAGE_FORMATS)]
+
+def image_response(request: Request, data: bytes, etag: str, fmt: str, cache_control: str):
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type=IMAGE_FORMATS[fmt][1], headers=headers)
+
+@router.get("/api/v1/images/{size}.{fmt}")
+async def image_thumbnail(size: ImageSize, fmt: ImageFormat, src: Annotated[str, Query(min_length=1, max_length=2048)], request: Request):
+    key = await image_pipeline.resolve(src)
+    data = await image_pipeline.thumbnail(key, size, fmt)
+    # the source URL may start serving a different image, so this one is not immutable
+    return image_response(request, data, f'"{key}-{size}.{fmt}"', fmt, f"public, max-age={IMAGE_CACHE_MAX_AGE}")
+
+@router.get("/api/v1/images/{digest}/{size}.{fmt}")
+async def image_thumbnail_by_digest(digest: Annotated[str, Path(pattern="^[0-9a-f]{32}$")], size: ImageSize, fmt: ImageFormat, request: Request):
+    data = await image_pipeline.thumbnail(digest, size, fmt)
+    return image_response(request, data, f'"{digest}-{size}.{fmt}"', fmt, f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable")
+
+@router.post("/api/v1/images/", response_model=ImageUpload)
+async def upload_image(file: UploadFile, token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    await get_current_user(token, db)
+    key = await image_pipeline.store(await file.read())
+    return ImageUpload(digest=key, thumbnails={size: f"{IMAGE_BASE_URL}/api/v1/images/{key}/{size}.webp" for size in IMAGE_SIZES})
+
+###########################################################################################################
+########################################## IMAGE API ENDPOINTS ############################################
+###########################################################################################################
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AUTO_CREATE_SCHEMA:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    if DB_WARMUP_CONNECTIONS:
+        await warm_up(DB_WARMUP_CONNECTIONS)
+    await stock_levels.ensure_loaded()
+    yield
+    await stock_levels.stop()
+    await otp_dispatcher.stop()
+    await rankings.stop()
+    hashing_service.shutdown()
+    await async_engine.dispose()
+    await replicas.dispose()
+    await image_pipeline.close()
+
+def create_app():
+    logging.basicConfig(level=config('LOG_LEVEL', default='INFO'))
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(InstrumentationMiddleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
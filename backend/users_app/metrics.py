@@ -0,0 +1,182 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from decouple import config
+
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=500, cast=float)
+SLOW_REQUEST_MAX_QUERIES = config('SLOW_REQUEST_MAX_QUERIES', default=50, cast=int)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per bucket counts..., +Inf count, sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            braces = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{braces} {series[-1]}")
+            lines.append(f"{self.name}_count{braces} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series: dict[tuple, float] = {}
+
+    def inc(self, value: float, *label_values):
+        self.series[label_values] = self.series.get(label_values, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.series.items()):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+request_duration = Histogram("http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+request_queries = Counter("http_request_db_queries_total", "Database queries issued while serving a route", ("method", "route"))
+request_query_time = Counter("http_request_db_query_seconds_total", "Time spent in database queries while serving a route", ("method", "route"))
+query_duration = Histogram("db_query_duration_seconds", "Latency of single database queries", ())
+span_duration = Histogram("span_duration_seconds", "Latency of timed operations such as bcrypt and OTP delivery", ("span",))
+# in-memory assignment is far below the request buckets
+dispatch_duration = Histogram("dispatch_assign_duration_seconds", "Latency of assigning an order to a rider", ("strategy",),
+                              buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005))
+dispatch_assignments = Counter("dispatch_assignments_total", "Orders assigned to riders, left pending or moved by a rebalance", ("city", "outcome"))
+REGISTRY = [request_duration, request_queries, request_query_time, query_duration, span_duration, dispatch_duration, dispatch_assignments]
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "spans", "finished")
+
+    def __init__(self):
+        self.queries: list[tuple[str, float]] = []
+        self.query_time = 0.0
+        self.spans: dict[str, float] = {}
+        self.finished = False
+
+
+# tasks spawned during a request copy this, so writes are dropped once the request has finished
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the execution context, so a statement that raises leaves nothing behind on the connection
+    context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    query_duration.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None and not stats.finished:
+        stats.queries.append((statement, elapsed))
+        stats.query_time += elapsed
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        span_duration.observe(elapsed, name)
+        stats = current_request.get()
+        if stats is not None and not stats.finished:
+            stats.spans[name] = stats.spans.get(name, 0.0) + elapsed
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.route_templates = {}
+
+    def route_template(self, scope):
+        # label by the declared path, raw paths with ids would make a series per id
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self.route_templates:
+            self.route_templates.update({route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")})
+        return self.route_templates.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.finished = True
+            current_request.reset(token)
+            method, route = scope["method"], self.route_template(scope)
+            request_duration.observe(elapsed, method, route, status_code)
+            request_queries.inc(len(stats.queries), method, route)
+            request_query_time.inc(stats.query_time, method, route)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(method, scope["path"], status_code, elapsed, stats)
+
+
+def log_slow_request(method: str, path: str, status_code: int, elapsed: float, stats: RequestStats):
+    queries = "\n".join(
+        f"  {seconds * 1000:8.2f} ms  {' '.join(statement.split())}"
+        for statement, seconds in stats.queries[:SLOW_REQUEST_MAX_QUERIES]
+    )
+    spans = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in stats.spans.items())
+    logger.warning(
+        "slow request %s %s -> %s in %.1f ms, %d queries in %.1f ms%s\n%s",
+        method, path, status_code, elapsed * 1000, len(stats.queries), stats.query_time * 1000,
+        f", spans {spans}" if spans else "", queries,
+    )
+
+
+def render_metrics(gauges: dict[str, float] | None = None):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, value in (gauges or {}).items():
+        lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
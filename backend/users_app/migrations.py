@@ -0,0 +1,136 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, engine
+from .crud import get_lookup_key, PASSWORD_LOOKUP_PREVIOUS_KEY
+from .hashing import find_hash, HASH_WORKERS
+from .ratings import weighted_score
+from . import models
+
+
+def add_password_lookup_key(engine=engine):
+    columns = [column["name"] for column in inspect(engine).get_columns(models.Password.__tablename__)]
+    if "lookup_key" in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE passwords ADD COLUMN lookup_key VARCHAR(64)"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_passwords_lookup_key ON passwords (lookup_key)"))
+    return True
+
+def add_catalogue_indexes(engine=engine):
+    for table in (models.Food.__table__, models.Restaurant.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def add_rating_scores(engine=engine):
+    for table in (models.Food.__table__, models.Restaurant.__table__):
+        columns = [column["name"] for column in inspect(engine).get_columns(table.name)]
+        if "score" in columns:
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN score FLOAT NOT NULL DEFAULT 0"))
+            conn.execute(update(table).values(score=weighted_score(table.c.ratings, table.c.number_of_raters)))
+
+def add_order_columns(engine=engine):
+    columns = [column["name"] for column in inspect(engine).get_columns(models.Order.__tablename__)]
+    added = {
+        "food_id": "INTEGER REFERENCES management_food (id)",
+        "restaurant_id": "INTEGER REFERENCES management_restaurant (id)",
+        "amount": "FLOAT",
+        "status": "VARCHAR(20) NOT NULL DEFAULT 'queued'",
+        "promised_at": "DATETIME",
+        "idempotency_key": "VARCHAR(64)",
+    }
+    with engine.begin() as conn:
+        for name, ddl in added.items():
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE orders ADD COLUMN {name} {ddl}"))
+        if "status" not in columns:
+            # orders from before the kitchen queue are long finished, left 'queued' they would be
+            # cooked again and counted as load on their salesman. New orders still default to 'queued'.
+            conn.execute(text("UPDATE orders SET status = 'delivered'"))
+    constraints = [constraint["name"] for constraint in inspect(engine).get_unique_constraints(models.Order.__tablename__)]
+    indexes = [index["name"] for index in inspect(engine).get_indexes(models.Order.__tablename__)]
+    with engine.begin() as conn:
+        if "uq_orders_customer_idempotency_key" not in constraints + indexes:
+            conn.execute(text("CREATE UNIQUE INDEX uq_orders_customer_idempotency_key ON orders (customer_id, idempotency_key)"))
+    for index in models.Order.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+def add_order_rollups(engine=engine):
+    # backfill afterwards with python -m users_app.analytics
+    models.OrderDailyRollup.__table__.create(bind=engine, checkfirst=True)
+
+def rekey_password_lookup_keys(db: Session, previous_key: str, batch_size: int = 1000):
+    # moves lookup keys made with previous_key over to PASSWORD_LOOKUP_KEY, one HMAC pair per user.
+    # Rows from before lookup_key existed are matched by backfill_password_lookup_keys instead.
+    rekeyed = 0
+    changes = []
+    for salt, special_key in db.query(models.User.salt, models.User.special_key).all():
+        sk = salt + special_key
+        changes.append({"previous": get_lookup_key(sk, previous_key), "current": get_lookup_key(sk)})
+        if len(changes) >= batch_size:
+            rekeyed += apply_rekey(db, changes)
+            changes = []
+    if changes:
+        rekeyed += apply_rekey(db, changes)
+    db.commit()
+    return rekeyed
+
+def apply_rekey(db: Session, changes: list[dict]):
+    stmt = update(models.Password).where(models.Password.lookup_key == bindparam("previous")).values(lookup_key=bindparam("current"))
+    return db.connection().execute(stmt, changes).rowcount
+
+def backfill_password_lookup_keys(db: Session, workers: int = HASH_WORKERS, commit_every: int = 100):
+    # rows from before lookup_key existed can only be tied to their user by bcrypt. Users are
+    # scanned on a process pool against the rows nobody has matched yet, and every match leaves
+    # that set, so each scan is shorter than the one before. Progress is committed as it goes
+    # and a rerun picks up the rows still left.
+    Password, User = models.Password, models.User
+    candidates = set(db.scalars(select(Password.hashed_key).filter(Password.lookup_key.is_(None))))
+    if not candidates:
+        return 0
+    known = set(db.scalars(select(Password.lookup_key).filter(Password.lookup_key.is_not(None))))
+    users = iter([
+        salt + special_key for salt, special_key in db.execute(select(User.salt, User.special_key))
+        if get_lookup_key(salt + special_key) not in known
+    ])
+    matched = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while True:
+            while candidates and len(running) < workers and (sk := next(users, None)) is not None:
+                running[pool.submit(find_hash, sk, list(candidates))] = sk
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                sk = running.pop(future)
+                hashed_key = future.result()
+                if hashed_key in candidates:
+                    candidates.discard(hashed_key)
+                    db.execute(update(Password).where(Password.hashed_key == hashed_key).values(lookup_key=get_lookup_key(sk)))
+                    matched += 1
+                    if matched % commit_every == 0:
+                        db.commit()
+    db.commit()
+    return matched
+
+
+# brings a database created by create_all before alembic up to revision 0001,
+# afterwards run `alembic stamp 0001` and use alembic from then on
+if __name__ == "__main__":
+    add_password_lookup_key()
+    add_catalogue_indexes()
+    add_rating_scores()
+    add_order_columns()
+    add_order_rollups()
+    db = SessionLocal()
+    try:
+        if PASSWORD_LOOKUP_PREVIOUS_KEY:
+            print(f"re-keyed {rekey_password_lookup_keys(db, PASSWORD_LOOKUP_PREVIOUS_KEY)} password rows")
+        print(f"backfilled lookup keys for {backfill_password_lookup_keys(db)} password rows")
+    finally:
+        db.close()
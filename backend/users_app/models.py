@@ -1,6 +1,7 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Float, Date
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Float, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+from .ratings import default_score
 # from .database import Base
 
 Base =  declarative_base()
@@ -27,6 +28,7 @@ class Password(Base):
     __tablename__ = "passwords"
 
     hashed_key = Column(String(250), primary_key=True, nullable=False)
+    lookup_key = Column(String(64), unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
 
 class District(Base):
@@ -47,10 +49,21 @@ class Food(Base):
     price = Column(Float, nullable=False)
     ratings = Column(Float, nullable=False)
     number_of_raters = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False, default=default_score, server_default="0")
     restaurant_id = Column(Integer, ForeignKey('management_restaurant.id'))
+    # NULL means the food is not stock tracked. Written back from memory in batches,
+    # stock_order_id is the last order already subtracted from it.
+    stock = Column(Integer)
+    stock_order_id = Column(Integer, nullable=False, default=0, server_default="0")
 
     restaurant = relationship("Restaurant", back_populates="foods")
 
+    __table_args__ = (
+        Index("ix_management_food_ratings_id", "ratings", "id"),
+        # also serves plain restaurant_id lookups through its leftmost column
+        Index("ix_management_food_restaurant_id_ratings", "restaurant_id", "ratings"),
+    )
+
 class Restaurant(Base):
     __tablename__ = 'management_restaurant'
 
@@ -60,10 +73,15 @@ class Restaurant(Base):
     cover_photo = Column(String(255), nullable=False)
     ratings = Column(Float, nullable=False)
     number_of_raters = Column(Integer, nullable=False)
-    district_id = Column(Integer, ForeignKey('management_district.id'))
+    score = Column(Float, nullable=False, default=default_score, server_default="0")
+    district_id = Column(Integer, ForeignKey('management_district.id'), index=True)
 
     district = relationship("District", back_populates="restaurants")
-    foods = relationship("Food", back_populates="restaurant")
+    foods = relationship("Food", back_populates="restaurant", order_by="desc(Food.ratings)")
+
+    __table_args__ = (
+        Index("ix_management_restaurant_ratings_id", "ratings", "id"),
+    )
 
 
 
@@ -102,10 +120,35 @@ class Order(Base):
     ord_date = Column(Date, nullable=False)
     customer_id = Column(Integer, ForeignKey('customer.customer_id'))
     salesman_id = Column(Integer, ForeignKey('salesman.salesman_id'))
+    food_id = Column(Integer, ForeignKey('management_food.id'))
+    restaurant_id = Column(Integer, ForeignKey('management_restaurant.id'))
+    amount = Column(Float)
+    status = Column(String(20), nullable=False, default="queued", server_default="queued")
+    promised_at = Column(DateTime)
+    idempotency_key = Column(String(64))
 
     customer = relationship('Customer', back_populates='orders')
     salesman = relationship('Salesman', back_populates='orders')
 
+    __table_args__ = (
+        # a retried placement finds the first attempt through this instead of creating a duplicate
+        UniqueConstraint("customer_id", "idempotency_key", name="uq_orders_customer_idempotency_key"),
+        Index("ix_orders_restaurant_id_status", "restaurant_id", "status"),
+    )
+
+class OrderDailyRollup(Base):
+    __tablename__ = 'order_daily_rollups'
+
+    # salesman_id 0 collects orders with no salesman, a NULL would break the composite key
+    day = Column(Date, primary_key=True, nullable=False)
+    salesman_id = Column(Integer, primary_key=True, nullable=False)
+    city = Column(String(50), primary_key=True, nullable=False)
+    grade = Column(Integer, primary_key=True, nullable=False)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    commission = Column(Float, nullable=False, default=0)
+
 class Office(Base):
     __tablename__ = 'office'
 
@@ -1,34 +1,191 @@
 # Download the helper library from https://www.twilio.com/docs/python/install
-import os
-from twilio.rest import Client
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
 from pyotp import TOTP
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from decouple import config
 from .crud import get_current_user
+from .cache import TTLCache
+from .metrics import span
 
 
 # Find your Account SID and Auth Token at twilio.com/console
 # and set the environment variables. See http://twil.io/secure
 account_sid = config('ACCOUNT_SID')
 auth_token = config('AUTH_TOKEN')
-client = Client(account_sid, auth_token)
+OTP_FROM_NUMBER = config('OTP_FROM_NUMBER', default='+16198212933')
+OTP_TRANSPORT = config('OTP_TRANSPORT', default='twilio')
+OTP_WORKERS = config('OTP_WORKERS', default=4, cast=int)
+OTP_QUEUE_SIZE = config('OTP_QUEUE_SIZE', default=1000, cast=int)
+OTP_MAX_RETRIES = config('OTP_MAX_RETRIES', default=3, cast=int)
+OTP_RATE_PER_SECOND = config('OTP_RATE_PER_SECOND', default=10, cast=float)
+OTP_USER_COOLDOWN_SECONDS = config('OTP_USER_COOLDOWN_SECONDS', default=60, cast=int)
+OTP_DRAIN_SECONDS = config('OTP_DRAIN_SECONDS', default=10, cast=float)
 OTP_SECRET = "abcdefghijklMNOPQRSTUVWx"
 topt = TOTP(OTP_SECRET, interval=300)
 
+logger = logging.getLogger(__name__)
+
 
 # print(topt.verify('904580'))
 
-async def send_otp(token: str, db: Session):
-    user = await get_current_user(token, db)
-    print(user.phone)
-    message = client.messages \
-                .create(
-                     body=f"Your OTP is {topt.now()}",
-                     from_='+16198212933',
-                     to='+8801850099956'
-                 )
+class SMSTransport(ABC):
+    @abstractmethod
+    async def send(self, to: str, body: str) -> str:
+        ...
+
+
+class TwilioTransport(SMSTransport):
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # imported here so workers that never send an SMS don't pay for loading twilio
+            from twilio.rest import Client
+            self._client = Client(account_sid, auth_token)
+        return self._client
+
+    async def send(self, to: str, body: str):
+        # the twilio client is blocking, keep its network round-trip off the event loop
+        message = await asyncio.to_thread(self.client.messages.create, body=body, from_=OTP_FROM_NUMBER, to=to)
+        return message.sid
+
+
+class FakeTransport(SMSTransport):
+    def __init__(self):
+        self.sent: list[tuple[str, str]] = []
+
+    async def send(self, to: str, body: str):
+        self.sent.append((to, body))
+        return f"fake-{len(self.sent)}"
+
+
+TRANSPORTS = {
+    "twilio": TwilioTransport,
+    "fake": FakeTransport,
+}
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
 
-    print(message.sid)
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+class OTPDispatcher:
+    def __init__(self, transport: SMSTransport, workers: int = OTP_WORKERS, queue_size: int = OTP_QUEUE_SIZE,
+                 max_retries: int = OTP_MAX_RETRIES, rate: float = OTP_RATE_PER_SECOND, cooldown: int = OTP_USER_COOLDOWN_SECONDS):
+        self.transport = transport
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(rate)
+        self.recent = TTLCache(maxsize=100000, ttl=cooldown)
+        self.queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.sending = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_seconds: float = OTP_DRAIN_SECONDS):
+        if not self._tasks:
+            return
+        # OTPs already accepted get a bounded chance to go out before the workers are cancelled
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with %d OTPs unsent (%d queued, %d sending)",
+                           self.queue.qsize() + self.sending, self.queue.qsize(), self.sending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, to: str, body: str):
+        self.start()
+        if self.recent.get(to) is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="OTP already sent, try again later",
+                headers={"Retry-After": str(OTP_USER_COOLDOWN_SECONDS)},
+            )
+        try:
+            self.queue.put_nowait((to, body, time.monotonic()))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="OTP service is busy, try again later")
+        self.recent.set(to, True)
+
+    async def _worker(self):
+        while True:
+            to, body, queued_at = await self.queue.get()
+            self.sending += 1
+            try:
+                await self._deliver(to, body, queued_at)
+            finally:
+                self.sending -= 1
+                self.queue.task_done()
+
+    async def _deliver(self, to: str, body: str, queued_at: float):
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                with span("otp_send"):
+                    await self.transport.send(to, body)
+            except Exception:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    # let the user ask again instead of waiting out the cooldown
+                    self.recent.pop(to)
+                    logger.exception("OTP delivery to %s failed after %d attempts", to, attempt + 1)
+                    return
+                self.retried += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            latency = time.monotonic() - queued_at
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            return
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_avg_ms": self.latency_total / self.sent * 1000 if self.sent else 0.0,
+            "latency_max_ms": self.latency_max * 1000,
+        }
+
+
+otp_dispatcher = OTPDispatcher(TRANSPORTS[OTP_TRANSPORT]())
+
+
+async def send_otp(token: str, db: AsyncSession):
+    user = await get_current_user(token, db)
+    otp_dispatcher.enqueue(user.phone, f"Your OTP is {topt.now()}")
 
 def verify_otp(otp_str: str):
-    return topt.verify(otp_str)
\ No newline at end of file
+    return topt.verify(otp_str)
@@ -0,0 +1,51 @@
+import base64
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, and_, or_
+
+
+def encode_cursor(values: dict):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None, sort: str = "id"):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        values["id"] = int(values["id"])
+        if sort == "ratings":
+            values["ratings"] = float(values["ratings"])
+        return values
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def keyset(stmt: Select, model, after: dict | None, sort: str, limit: int):
+    # seek past the last row of the previous page instead of OFFSET, so every page costs one index range scan
+    if sort == "ratings":
+        stmt = stmt.order_by(model.ratings.desc(), model.id.desc())
+        if after is not None:
+            stmt = stmt.filter(or_(
+                model.ratings < after["ratings"],
+                and_(model.ratings == after["ratings"], model.id < after["id"]),
+            ))
+    else:
+        stmt = stmt.order_by(model.id)
+        if after is not None:
+            stmt = stmt.filter(model.id > after["id"])
+    # one extra row tells us whether a next page exists
+    return stmt.limit(limit + 1)
+
+def make_page(rows, sort: str, limit: int):
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = {"id": last.id}
+        if sort == "ratings":
+            values["ratings"] = last.ratings
+        next_cursor = encode_cursor(values)
+    return {"items": rows, "next_cursor": next_cursor}
@@ -0,0 +1,159 @@
+import asyncio
+import bisect
+import logging
+
+from sqlalchemy import select
+from decouple import config
+
+from . import models, schemas
+from .database import replicas
+
+RANKING_SIZE = config('RANKING_SIZE', default=20, cast=int)
+RANKING_REFRESH_SECONDS = config('RANKING_REFRESH_SECONDS', default=300, cast=int)
+
+logger = logging.getLogger(__name__)
+
+
+def sort_key(item: schemas.Food | schemas.Restaurant):
+    # ascending order is best first: highest score, the mean ratings pulled towards the prior until
+    # number_of_raters outweighs it, then most raters, then the oldest id
+    return (-item.score, -item.number_of_raters, item.id)
+
+
+class TopN:
+    # every member's sort key in one list kept sorted with bisect, so an update finds its old
+    # and new place in O(log n) and only rebuilds the top when one of them is inside it
+    def __init__(self, size: int = RANKING_SIZE):
+        self.size = size
+        self.members: dict[int, schemas.Food | schemas.Restaurant] = {}
+        self.order: list[tuple] = []
+        self.top: list[schemas.Food | schemas.Restaurant] = []
+
+    def load(self, items: list[schemas.Food | schemas.Restaurant]):
+        # one sort instead of an insert per member
+        self.members = {item.id: item for item in items}
+        self.order = sorted(map(sort_key, self.members.values()))
+        self.refresh()
+        return self
+
+    def update(self, item: schemas.Food | schemas.Restaurant):
+        was_ranked = self.discard(item.id)
+        key = sort_key(item)
+        index = bisect.bisect_left(self.order, key)
+        self.order.insert(index, key)
+        self.members[item.id] = item
+        if was_ranked or index < self.size:
+            self.refresh()
+
+    def remove(self, item_id: int):
+        if self.discard(item_id):
+            self.refresh()
+
+    def discard(self, item_id: int):
+        # True when the member was in the top
+        item = self.members.pop(item_id, None)
+        if item is None:
+            return False
+        index = bisect.bisect_left(self.order, sort_key(item))
+        del self.order[index]
+        return index < self.size
+
+    def refresh(self):
+        self.top = [self.members[item_id] for *_, item_id in self.order[:self.size]]
+
+
+class Rankings:
+    def __init__(self, size: int = RANKING_SIZE):
+        self.size = size
+        self.restaurants_by_district: dict[int, TopN] = {}
+        self.foods_by_district: dict[int, TopN] = {}
+        self.foods = TopN(size)
+        self.restaurant_district: dict[int, int] = {}
+        self.food_district: dict[int, int] = {}
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        self._refresher: asyncio.Task | None = None
+
+    def update_restaurant(self, restaurant: models.Restaurant):
+        restaurant = schemas.Restaurant.model_validate(restaurant)
+        self.restaurant_district[restaurant.id] = restaurant.district_id
+        self.restaurants_by_district.setdefault(restaurant.district_id, TopN(self.size)).update(restaurant)
+
+    def update_food(self, food: models.Food):
+        food = schemas.Food.model_validate(food)
+        self.foods.update(food)
+        district_id = self.restaurant_district.get(food.restaurant_id)
+        old_district_id = self.food_district.get(food.id)
+        if old_district_id is not None and old_district_id != district_id:
+            self.foods_by_district[old_district_id].remove(food.id)
+        if district_id is not None:
+            self.food_district[food.id] = district_id
+            self.foods_by_district.setdefault(district_id, TopN(self.size)).update(food)
+
+    def load(self, restaurants: list[schemas.Restaurant], foods: list[schemas.Food]):
+        self.restaurant_district = {restaurant.id: restaurant.district_id for restaurant in restaurants}
+        self.food_district = {
+            food.id: self.restaurant_district[food.restaurant_id]
+            for food in foods if food.restaurant_id in self.restaurant_district
+        }
+        restaurants_by_district: dict[int, list] = {}
+        for restaurant in restaurants:
+            restaurants_by_district.setdefault(restaurant.district_id, []).append(restaurant)
+        foods_by_district: dict[int, list] = {}
+        for food in foods:
+            if food.id in self.food_district:
+                foods_by_district.setdefault(self.food_district[food.id], []).append(food)
+        self.restaurants_by_district = {district_id: TopN(self.size).load(members) for district_id, members in restaurants_by_district.items()}
+        self.foods_by_district = {district_id: TopN(self.size).load(members) for district_id, members in foods_by_district.items()}
+        self.foods.load(foods)
+
+    async def rebuild(self):
+        rankings = Rankings(self.size)
+        async with replicas.session() as db:
+            restaurants = [schemas.Restaurant.model_validate(restaurant) for restaurant in await db.scalars(select(models.Restaurant))]
+            foods = [schemas.Food.model_validate(food) for food in await db.scalars(select(models.Food))]
+        rankings.load(restaurants, foods)
+        # swap in whole so readers never see a half built ranking
+        self.restaurants_by_district = rankings.restaurants_by_district
+        self.foods_by_district = rankings.foods_by_district
+        self.foods = rankings.foods
+        self.restaurant_district = rankings.restaurant_district
+        self.food_district = rankings.food_district
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            async with self._load_lock:
+                if not self.loaded:
+                    await self.rebuild()
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_periodically())
+
+    def reset(self):
+        self.loaded = False
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh_periodically(self):
+        # catches writes that bypass the incremental hooks, e.g. other workers or manual SQL
+        while True:
+            await asyncio.sleep(RANKING_REFRESH_SECONDS)
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("ranking refresh failed")
+
+    def top_restaurants(self, district_id: int, limit: int = RANKING_SIZE):
+        ranking = self.restaurants_by_district.get(district_id)
+        return ranking.top[:limit] if ranking is not None else []
+
+    def top_foods(self, district_id: int | None = None, limit: int = RANKING_SIZE):
+        ranking = self.foods if district_id is None else self.foods_by_district.get(district_id)
+        return ranking.top[:limit] if ranking is not None else []
+
+
+rankings = Rankings()
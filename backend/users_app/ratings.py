@@ -0,0 +1,24 @@
+from decouple import config
+
+# bayesian prior: every item starts as if RATING_PRIOR_WEIGHT raters had given it RATING_PRIOR_MEAN
+RATING_PRIOR_MEAN = config('RATING_PRIOR_MEAN', default=3.0, cast=float)
+RATING_PRIOR_WEIGHT = config('RATING_PRIOR_WEIGHT', default=10, cast=int)
+
+
+def weighted_score(ratings, number_of_raters):
+    return (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + ratings * number_of_raters) / (RATING_PRIOR_WEIGHT + number_of_raters)
+
+def default_score(context):
+    params = context.get_current_parameters()
+    return weighted_score(params["ratings"], params["number_of_raters"])
+
+def add_rating(model, rating: float):
+    # every expression reads only the old row, and the assignments are ordered for MySQL,
+    # which evaluates SET left to right against the already updated columns
+    total = model.ratings * model.number_of_raters + rating
+    count = model.number_of_raters + 1
+    return [
+        (model.score, (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + total) / (RATING_PRIOR_WEIGHT + count)),
+        (model.ratings, total / count),
+        (model.number_of_raters, count),
+    ]
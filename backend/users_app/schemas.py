@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from datetime import date, datetime
+
+from pydantic import BaseModel, Field, computed_field
+
+from .images import thumbnail_urls
 
 class UserBase(BaseModel):
     full_name: str
@@ -19,6 +23,11 @@ class User(UserBase):
     is_active: bool
     # items: list[Item] = []
 
+    @computed_field
+    @property
+    def photo_thumbnails(self) -> dict[str, str]:
+        return thumbnail_urls(self.photo_url)
+
     class Config:
         from_attributes = True
 
@@ -28,6 +37,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     user_email: str | None = None
+    user_id: int | None = None
+    is_active: bool | None = None
 
 class PasswordBase(BaseModel):
     hashed_key: str
@@ -46,6 +57,11 @@ class DistrictBase(BaseModel):
 class District(DistrictBase):
     id: int
 
+    @computed_field
+    @property
+    def image_thumbnails(self) -> dict[str, str]:
+        return thumbnail_urls(self.image_url)
+
     class Config:
         from_attributes = True
 
@@ -62,6 +78,12 @@ class RestaurantCreate(RestaurantBase):
 
 class Restaurant(RestaurantBase):
     id: int
+    score: float = 0
+
+    @computed_field
+    @property
+    def cover_photo_thumbnails(self) -> dict[str, str]:
+        return thumbnail_urls(self.cover_photo)
 
     class Config:
         from_attributes = True
@@ -79,10 +101,128 @@ class FoodCreate(FoodBase):
 
 class Food(FoodBase):
     id: int
+    score: float = 0
+
+    @computed_field
+    @property
+    def food_image_thumbnails(self) -> dict[str, str]:
+        return thumbnail_urls(self.food_image)
+
+    # read from the in-memory counters, None when the food is not stock tracked. Imported here
+    # because stock needs the database, and schemas must stay importable without one.
+    @computed_field
+    @property
+    def remaining(self) -> int | None:
+        from .stock import stock_levels
+        return stock_levels.remaining.get(self.id)
+
+    @computed_field
+    @property
+    def available(self) -> bool:
+        from .stock import stock_levels
+        return stock_levels.available(self.id)
+
+    class Config:
+        from_attributes = True
+
+class RestaurantWithMenu(Restaurant):
+    foods: list[Food] = []
+
+class DistrictWithRestaurants(District):
+    restaurants: list[Restaurant] = []
+
+class Rating(BaseModel):
+    rating: float = Field(ge=1, le=5)
+
+class StockUpdate(BaseModel):
+    # null stops tracking the food's stock
+    stock: int | None = Field(ge=0)
+
+class SearchResults(BaseModel):
+    foods: list[Food] = []
+    restaurants: list[Restaurant] = []
+
+class OrderCreate(BaseModel):
+    customer_id: int
+    food_id: int
+    quantity: int = Field(ge=1, le=100)
+    salesman_id: int | None = None
+    promised_at: datetime | None = None
+
+class Order(BaseModel):
+    id: int
+    customer_id: int
+    food_id: int
+    restaurant_id: int
+    salesman_id: int | None = None
+    quantity: int
+    amount: float
+    status: str
+    ord_date: date
+    promised_at: datetime
 
     class Config:
         from_attributes = True
 
+class DispatchStatus(BaseModel):
+    city: str
+    riders_online: int
+    riders_at_capacity: int
+    active_orders: int
+    pending_orders: int
+
+class RebalanceReport(BaseModel):
+    city: str
+    moved: int
+    status: DispatchStatus
+
+class KitchenStatus(BaseModel):
+    restaurant_id: int
+    queue_depth: int
+    queued_items: int
+    estimated_prep_seconds: int
+    next_promised_at: datetime | None = None
+
+class RevenueDay(BaseModel):
+    day: date
+    orders: int
+    quantity: int
+    revenue: float
+
+class SalesmanReport(BaseModel):
+    salesman_id: int
+    name: str
+    orders: int
+    revenue: float
+    commission: float
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    kind: str
+    inserted: int
+    failed: int
+    errors: list[ImportRowError] = []
+
+class ProvisionReport(BaseModel):
+    created: list[User]
+    failed: int
+    errors: list[ImportRowError] = []
+
+class ImageUpload(BaseModel):
+    digest: str
+    thumbnails: dict[str, str]
+
+class FoodPage(BaseModel):
+    items: list[Food]
+    next_cursor: str | None = None
+
+class RestaurantPage(BaseModel):
+    items: list[Restaurant]
+    next_cursor: str | None = None
+
 
 ##########################################
 # ************************************** #
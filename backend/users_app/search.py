@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import re
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings: dict[str, set[int]] = {}
+        # per term, rank keys (best first, doc id last) so top-k reads stop after k hits
+        self.ranked: dict[str, list[tuple]] = {}
+        self.rank: dict[int, tuple] = {}
+        # sorted vocabulary, a prefix is a contiguous run found with one bisect
+        self.terms: list[str] = []
+
+    def add(self, doc_id: int, text: str, rank: tuple):
+        self.rank[doc_id] = rank
+        for term in set(tokenize(text)):
+            if term not in self.postings:
+                self.postings[term] = set()
+                self.ranked[term] = []
+                insort(self.terms, term)
+            self.postings[term].add(doc_id)
+            insort(self.ranked[term], rank)
+
+    def remove(self, doc_id: int, text: str, rank: tuple):
+        self.rank.pop(doc_id, None)
+        for term in set(tokenize(text)):
+            if term not in self.postings:
+                continue
+            self.postings[term].discard(doc_id)
+            ranked = self.ranked[term]
+            i = bisect_left(ranked, rank)
+            if i < len(ranked) and ranked[i] == rank:
+                del ranked[i]
+
+    def matching_terms(self, prefix: str):
+        i = bisect_left(self.terms, prefix)
+        terms = []
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            terms.append(self.terms[i])
+            i += 1
+        return terms
+
+    def search(self, query: str, limit: int, accept=None):
+        matched = [self.matching_terms(token) for token in tokenize(query)]
+        if not matched or not all(matched):
+            return []
+        sizes = [sum(len(self.postings[term]) for term in terms) for terms in matched]
+        driver = matched.pop(sizes.index(min(sizes)))
+        candidates = None
+        if matched:
+            # set algebra runs in C, cheap even when every token is common
+            candidates = set().union(*(self.postings[term] for term in driver))
+            for terms in matched:
+                candidates.intersection_update(set().union(*(self.postings[term] for term in terms)))
+            if len(candidates) * 8 < min(sizes):
+                # sparse matches: rank just the survivors
+                ranked = sorted(self.rank[doc_id] for doc_id in candidates)
+                return [rank[-1] for rank in ranked if accept is None or accept(rank[-1])][:limit]
+        # dense matches: walk the driver in rank order and stop after limit hits
+        results = []
+        seen = set()
+        for rank in heapq.merge(*(self.ranked[term] for term in driver)):
+            doc_id = rank[-1]
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            if candidates is not None and doc_id not in candidates:
+                continue
+            if accept is not None and not accept(doc_id):
+                continue
+            results.append(doc_id)
+            if len(results) == limit:
+                break
+        return results
+
+
+def food_rank(food: schemas.Food):
+    return (-food.ratings, -food.number_of_raters, food.id)
+
+def restaurant_rank(restaurant: schemas.Restaurant):
+    return (-restaurant.ratings, -restaurant.number_of_raters, restaurant.id)
+
+
+class CatalogueSearch:
+    def __init__(self):
+        self.foods: dict[int, schemas.Food] = {}
+        self.restaurants: dict[int, schemas.Restaurant] = {}
+        self.food_terms = InvertedIndex()
+        self.restaurant_terms = InvertedIndex()
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def reset(self):
+        # bulk writes don't hand back their rows, the next search rebuilds from the database
+        self.foods = {}
+        self.restaurants = {}
+        self.food_terms = InvertedIndex()
+        self.restaurant_terms = InvertedIndex()
+        self.loaded = False
+
+    async def ensure_loaded(self, db: AsyncSession):
+        # built once per process, create_food/create_restaurant keep it current afterwards
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            for restaurant in await db.scalars(select(models.Restaurant)):
+                self.add_restaurant(restaurant)
+            for food in await db.scalars(select(models.Food)):
+                self.add_food(food)
+            self.loaded = True
+
+    def add_food(self, food: models.Food):
+        food = schemas.Food.model_validate(food)
+        old = self.foods.get(food.id)
+        if old is not None:
+            self.food_terms.remove(old.id, old.food_name, food_rank(old))
+        self.foods[food.id] = food
+        self.food_terms.add(food.id, food.food_name, food_rank(food))
+
+    def add_restaurant(self, restaurant: models.Restaurant):
+        restaurant = schemas.Restaurant.model_validate(restaurant)
+        old = self.restaurants.get(restaurant.id)
+        if old is not None:
+            self.restaurant_terms.remove(old.id, f"{old.restaurant_name} {old.restaurant_address}", restaurant_rank(old))
+        self.restaurants[restaurant.id] = restaurant
+        self.restaurant_terms.add(restaurant.id, f"{restaurant.restaurant_name} {restaurant.restaurant_address}", restaurant_rank(restaurant))
+
+    def search_foods(self, q: str, district_id: int | None = None, min_price: float | None = None, max_price: float | None = None, limit: int = 20):
+        def accept(food_id: int):
+            food = self.foods[food_id]
+            if min_price is not None and food.price < min_price:
+                return False
+            if max_price is not None and food.price > max_price:
+                return False
+            if district_id is not None:
+                restaurant = self.restaurants.get(food.restaurant_id)
+                return restaurant is not None and restaurant.district_id == district_id
+            return True
+        return [self.foods[food_id] for food_id in self.food_terms.search(q, limit, accept)]
+
+    def search_restaurants(self, q: str, district_id: int | None = None, limit: int = 20):
+        def accept(restaurant_id: int):
+            return district_id is None or self.restaurants[restaurant_id].district_id == district_id
+        return [self.restaurants[restaurant_id] for restaurant_id in self.restaurant_terms.search(q, limit, accept)]
+
+
+catalogue_search = CatalogueSearch()
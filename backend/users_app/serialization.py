@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from typing import Literal
+
+import orjson
+from sqlalchemy import select
+
+from . import models, schemas
+
+Layout = Literal["rows", "columns"]
+
+
+class RowEncoder:
+    # selects exactly the response schema's fields and encodes the tuples directly,
+    # database output is trusted so no model is built or validated per row
+    def __init__(self, model, schema):
+        self.fields = tuple(schema.model_fields)
+        self.columns = tuple(getattr(model, name) for name in self.fields)
+        # computed fields such as thumbnail URLs, evaluated against a plain namespace instead of a model
+        self.computed = tuple((name, info.wrapped_property.fget) for name, info in schema.model_computed_fields.items())
+
+    def select(self):
+        return select(*self.columns)
+
+    def encode(self, rows, layout: Layout = "rows"):
+        fields = self.fields
+        items = [dict(zip(fields, row)) for row in rows]
+        for item in items if self.computed else ():
+            view = SimpleNamespace(**item)
+            for name, compute in self.computed:
+                item[name] = compute(view)
+        if layout == "columns":
+            names = fields + tuple(name for name, _ in self.computed)
+            return orjson.dumps({name: [item[name] for item in items] for name in names})
+        return orjson.dumps(items)
+
+
+district_rows = RowEncoder(models.District, schemas.District)
+food_rows = RowEncoder(models.Food, schemas.Food)
+restaurant_rows = RowEncoder(models.Restaurant, schemas.Restaurant)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+
+from . import models
+from .cache import catalogue_cache
+from .database import AsyncSessionLocal
+
+STOCK_FLUSH_SECONDS = config('STOCK_FLUSH_SECONDS', default=2, cast=float)
+
+logger = logging.getLogger(__name__)
+
+
+class StockLevels:
+    # counters live in this process and are written back in batches, so orders never lock
+    # management_food rows. Foods with a NULL stock are not tracked and always available.
+    # One process must own the counters, like the kitchen queues.
+    def __init__(self):
+        self.remaining: dict[int, int] = {}
+        self.dirty: set[int] = set()
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            async with self._load_lock:
+                if not self.loaded:
+                    async with AsyncSessionLocal() as db:
+                        self.remaining = await recover(db)
+                    self.loaded = True
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    def available(self, food_id: int):
+        remaining = self.remaining.get(food_id)
+        return remaining is None or remaining > 0
+
+    # reserve and release never await, so they are atomic on the event loop
+    def reserve(self, food_id: int, quantity: int):
+        remaining = self.remaining.get(food_id)
+        if remaining is None:
+            return True
+        if remaining < quantity:
+            return False
+        self.remaining[food_id] = remaining - quantity
+        self.dirty.add(food_id)
+        if remaining == quantity:
+            # sold out shows up in listings right away, other changes wait for the flush
+            catalogue_cache.invalidate("food")
+        return True
+
+    def release(self, food_id: int, quantity: int):
+        remaining = self.remaining.get(food_id)
+        if remaining is None:
+            return
+        self.remaining[food_id] = remaining + quantity
+        self.dirty.add(food_id)
+        if remaining == 0:
+            catalogue_cache.invalidate("food")
+
+    async def set_stock(self, db: AsyncSession, food_id: int, stock: int | None):
+        async with self._write_lock:
+            db_food = await db.get(models.Food, food_id)
+            if db_food is None:
+                return None
+            db_food.stock = stock
+            db_food.stock_order_id = await last_order_id(db)
+            await db.commit()
+            if stock is None:
+                self.remaining.pop(food_id, None)
+            else:
+                self.remaining[food_id] = stock
+            self.dirty.discard(food_id)
+        catalogue_cache.invalidate("food")
+        return db_food
+
+    async def flush(self):
+        if not self.dirty:
+            return 0
+        async with self._write_lock:
+            async with AsyncSessionLocal() as db:
+                # every order up to the watermark reserved before this point, so the counters
+                # taken below already include it. Later orders may be counted again on recovery,
+                # which can only under-count stock, never oversell it.
+                watermark = await last_order_id(db)
+                dirty, self.dirty = self.dirty, set()
+                values = [
+                    {"id": food_id, "stock": self.remaining[food_id], "stock_order_id": watermark}
+                    for food_id in dirty if food_id in self.remaining
+                ]
+                try:
+                    if values:
+                        await db.execute(update(models.Food), values)
+                    await db.commit()
+                except Exception:
+                    self.dirty |= dirty
+                    raise
+        catalogue_cache.invalidate("food")
+        return len(values)
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(STOCK_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("stock flush failed")
+
+
+async def last_order_id(db: AsyncSession):
+    return await db.scalar(select(func.coalesce(func.max(models.Order.id), 0)))
+
+async def recover(db: AsyncSession):
+    # the flushed stock minus every order placed after it was flushed
+    sold_since = (
+        select(models.Order.food_id, func.sum(models.Order.quantity).label("quantity"))
+        .join(models.Food, models.Food.id == models.Order.food_id)
+        .filter(models.Order.id > models.Food.stock_order_id)
+        .group_by(models.Order.food_id)
+        .subquery()
+    )
+    stmt = (
+        select(models.Food.id, models.Food.stock - func.coalesce(sold_since.c.quantity, 0))
+        .outerjoin(sold_since, sold_since.c.food_id == models.Food.id)
+        .filter(models.Food.stock.is_not(None))
+    )
+    return {food_id: max(remaining, 0) for food_id, remaining in await db.execute(stmt)}
+
+
+stock_levels = StockLevels()